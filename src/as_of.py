@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from matchups import pack_team_key, TEAM_BASE
+from team_games import close_games, box_score_features, opponent_features, BOX_SCORE_TOTALS
+
+# the stats features are end of season snapshots. for backtests on mid season / tournament day states the
+# team-game table is sorted by (Season, TeamID, DayNum) once and every total is accumulated per team-season
+# in one pass; a snapshot is then a binary search per team into those running totals, not a rebuild.
+# a snapshot "as of day D" holds the games played before day D, i.e. what was known going into day D's games.
+DAY_BASE = 1_000
+
+
+def _group_cumsum(values: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # running sum restarting at every group start
+    total = np.cumsum(values, dtype=np.float64)
+    before = total[starts] - values[starts]
+    return total - np.repeat(before, lengths)
+
+
+class AsOfFeatures(object):
+    def __init__(self, team_games: pd.DataFrame, windows: tuple = (10,)):
+        """
+        Args:
+            team_games (pd.DataFrame): team_games.team_game_table output (compact or detailed results).
+            windows (tuple, optional): last-N game windows. N gives win_perc_lN (wins/N, like win_perc_l10)
+                and margin_lN (average point margin over those games).
+        """
+        df = team_games.sort_values(['Season', 'TeamID', 'DayNum', 'game_id'], kind='stable')
+        group_key = pack_team_key(df['Season'].to_numpy(), df['TeamID'].to_numpy())
+        new_group = np.r_[True, group_key[1:] != group_key[:-1]]
+        self.starts = np.flatnonzero(new_group)
+        self.lengths = np.diff(np.r_[self.starts, len(df)])
+        # packed Season/TeamID of every team-season, sorted
+        self.keys = group_key[self.starts]
+        group = np.cumsum(new_group) - 1
+        # (team-season, day) of every row, sorted, so a snapshot is one searchsorted
+        self.row_keys = group*DAY_BASE + df['DayNum'].to_numpy()
+        self.windows = tuple(windows)
+        self.has_box_score = all(c in df.columns for c in BOX_SCORE_TOTALS.values())
+
+        win = df['win'].to_numpy(np.float64)
+        close = close_games(df).to_numpy(np.float64)
+        margin = (df['Score'] - df['OppScore']).to_numpy(np.float64)
+        counts = {'games': np.ones(len(df)),
+                'wins': win,
+                'total_score': df['Score'].to_numpy(np.float64),
+                'opp_score': df['OppScore'].to_numpy(np.float64),
+                'close_games': close,
+                'close_wins': close*win,
+                'margin': margin}
+        if self.has_box_score:
+            counts.update({name: df[c].to_numpy(np.float64) for name, c in BOX_SCORE_TOTALS.items()})
+        self.totals = {name: _group_cumsum(v, self.starts, self.lengths) for name, v in counts.items()}
+
+        # last-N sums: running total minus the running total N games back (or 0 before the team's first game)
+        rows = np.arange(len(df))
+        row_start = np.repeat(self.starts, self.lengths)
+        for n in self.windows:
+            back = rows - n
+            has_back = back >= row_start
+            for name in ('wins', 'margin'):
+                total = self.totals[name]
+                self.totals[f"{name}_l{n}"] = total - np.where(has_back, total[np.maximum(back, 0)], 0)
+
+    def _positions(self, groups: np.ndarray, day_num) -> np.ndarray:
+        """Row holding each team-season's totals going into day_num, -1 if it had not played yet."""
+        pos = np.searchsorted(self.row_keys, groups*DAY_BASE + np.asarray(day_num, dtype=np.int64), side='left') - 1
+        return np.where((groups >= 0) & (pos >= self.starts[np.maximum(groups, 0)]), pos, -1)
+
+    def _features(self, keys: np.ndarray, pos: np.ndarray) -> pd.DataFrame:
+        played = pos >= 0
+        totals = pd.DataFrame({name: np.where(played, total[np.maximum(pos, 0)], np.nan) for name, total in self.totals.items()})
+        totals.insert(0, 'Season', keys//TEAM_BASE)
+        totals.insert(1, 'TeamID', keys % TEAM_BASE)
+        totals['l10_wins'] = totals['wins_l10'] if 10 in self.windows else np.nan
+        totals = opponent_features(totals)
+        if self.has_box_score:
+            totals = box_score_features(totals)
+        else:
+            totals['win_perc'] = totals['wins']/totals['games']
+            totals['ppg'] = totals['total_score']/totals['games']
+        for n in self.windows:
+            totals[f"win_perc_l{n}"] = totals[f"wins_l{n}"]/n
+            totals[f"margin_l{n}"] = totals[f"margin_l{n}"]/np.minimum(totals['games'], n)
+        return totals
+
+    def features_as_of(self, season: int, day_num: int) -> pd.DataFrame:
+        """Features of every team in season from the games played before day_num (teams yet to play are left out)."""
+        lo, hi = np.searchsorted(self.keys, pack_team_key([season, season + 1], 0))
+        groups = np.arange(lo, hi)
+        pos = self._positions(groups, np.full(len(groups), day_num))
+        played = pos >= 0
+        return self._features(self.keys[groups[played]], pos[played])
+
+    def lookup(self, season, team, day_num) -> pd.DataFrame:
+        """Features for arrays of (season, team, day_num), one row each in the given order (NaN before a
+        team's first game), e.g. the state of both teams going into every tournament game."""
+        keys = np.atleast_1d(pack_team_key(season, team))
+        groups = np.searchsorted(self.keys, keys)
+        found = (groups < len(self.keys)) & (self.keys[np.minimum(groups, len(self.keys) - 1)] == keys)
+        groups = np.where(found, groups, -1)
+        return self._features(keys, self._positions(groups, np.broadcast_to(day_num, keys.shape)))
@@ -0,0 +1,177 @@
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from data_cache import RawDataCache
+from raw_features import RawFeatures
+from label_data import build_labelled_data, matchup_data
+from head_to_head import build_head_to_head
+from synthetic_data import SCALES, generate
+
+# benchmark suite over synthetic data: times (best of --repeat) and traced peak memory (one extra run,
+# tracemalloc slows the code down) for every RawFeatures stage, the raw loaders, labelling, matchup
+# generation and head to head. results can be saved as a baseline and later runs checked against it.
+
+
+def measure(func, repeat: int = 1, trace_memory: bool = True):
+    """Run func repeat times; returns (last result, {'wall_s', 'cpu_s', 'peak_mb'})."""
+    wall, cpu = [], []
+    for _ in range(repeat):
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        result = func()
+        wall.append(time.perf_counter() - start_wall)
+        cpu.append(time.process_time() - start_cpu)
+    stats = {'wall_s': min(wall), 'cpu_s': min(cpu)}
+    if trace_memory:
+        tracemalloc.start()
+        result = func()
+        stats['peak_mb'] = tracemalloc.get_traced_memory()[1]/2**20
+        tracemalloc.stop()
+    return result, stats
+
+
+def _rows(result):
+    if isinstance(result, tuple):
+        result = result[0]
+    return len(result) if hasattr(result, '__len__') else None
+
+
+def benchmark_cases(data_dir: str, stage: int, cache_dir: str):
+    """(name, func) pairs. Stage cases share a warm cache so they time the feature code, not parsing."""
+    raw_path = lambda t: f"{data_dir}/MDataFiles_Stage{stage}/{t}.csv"
+    cases = []
+    tables = {t for type in ['stats', 'rank'] for t in RawFeatures(1985, 2022, stage, data_dir).input_tables(type)}
+    for table in sorted(tables - {'MMasseyOrdinals'}):
+        def parse(table=table):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            return RawDataCache(cache_dir=cache_dir).read_csv(raw_path(table))
+        cases.append((f"raw_csv_parse:{table}", parse))
+        cases.append((f"raw_binary_load:{table}", lambda table=table: RawDataCache(cache_dir=cache_dir).read_csv(raw_path(table))))
+
+    warm_cache = RawDataCache(cache_dir=cache_dir, max_frames=32)
+    for type in ['stats', 'rank']:
+        rf = RawFeatures(1985, 2022, stage, data_dir, cache=warm_cache)
+        rf.min_year, rf.max_year = rf.season_range(type)
+        cases.append((f"team_df_build:{type}", lambda rf=rf: rf.team_df_build() or rf.feature_set))
+        for feature_stage in rf.stages(type):
+            cases.append((f"stage:{feature_stage.name}", feature_stage.func))
+        cases.append((f"build_feature_set:{type}",
+                    lambda type=type: RawFeatures(1985, 2022, stage, data_dir, cache=warm_cache).build_feature_set(type, save=False)))
+
+    seasons = list(range(1985, 2023))
+    cases.append(('build_labelled_data', lambda: build_labelled_data(raw_path('MNCAATourneyCompactResults'))))
+    cases.append(('matchup_data', lambda: matchup_data(raw_path('MNCAATourneySeeds'), season=seasons)))
+
+    def head_to_head():
+        games = pd.concat([build_labelled_data(raw_path('MNCAATourneyCompactResults'), with_id=False),
+                            matchup_data(raw_path('MNCAATourneySeeds'), season=seasons, with_id=False).assign(Y=-1)])
+        features = RawFeatures(1985, 2022, stage, data_dir, cache=warm_cache).build_feature_set('stats', save=False)
+        return lambda: build_head_to_head(games[['Season', 'hTeamID', 'aTeamID', 'Y']], features)
+    cases.append(('build_head_to_head', head_to_head))
+    return cases
+
+
+def run_benchmarks(data_dir: str, stage: int = 2, repeat: int = 3, trace_memory: bool = True, only: str = None) -> dict:
+    cache_dir = tempfile.mkdtemp(prefix='mm_bench_cache_')
+    results = {}
+    try:
+        for name, func in benchmark_cases(data_dir, stage, cache_dir):
+            if only and only not in name:
+                continue
+            if name == 'build_head_to_head':
+                func = func()
+            result, stats = measure(func, repeat=repeat, trace_memory=trace_memory)
+            stats['rows'] = _rows(result)
+            results[name] = stats
+            print(f"{name:<50} {stats['wall_s']:8.3f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+def check_regressions(results: dict, baseline: dict, time_tolerance: float = 1.5, memory_tolerance: float = 1.25,
+                    min_seconds: float = .05, min_mb: float = 1.0) -> list:
+    """Benchmarks slower/bigger than baseline by more than the tolerance (and the noise floor)."""
+    regressions = []
+    for name, base in baseline.get('results', {}).items():
+        new = results.get(name)
+        if new is None:
+            continue
+        if new['wall_s'] > base['wall_s']*time_tolerance and new['wall_s'] - base['wall_s'] > min_seconds:
+            regressions.append(f"{name}: {base['wall_s']:.3f}s -> {new['wall_s']:.3f}s")
+        if 'peak_mb' in new and 'peak_mb' in base and new['peak_mb'] > base['peak_mb']*memory_tolerance \
+                and new['peak_mb'] - base['peak_mb'] > min_mb:
+            regressions.append(f"{name}: {base['peak_mb']:.1f}MB -> {new['peak_mb']:.1f}MB")
+    return regressions
+
+
+def format_table(results: dict, baseline: dict = None) -> str:
+    base = (baseline or {}).get('results', {})
+    lines = [f"{'benchmark':<50} {'wall_s':>9} {'cpu_s':>9} {'peak_mb':>9} {'rows':>10} {'vs_base':>8}"]
+    for name, r in results.items():
+        ratio = f"{r['wall_s']/base[name]['wall_s']:.2f}x" if name in base and base[name]['wall_s'] > 0 else ''
+        peak = f"{r['peak_mb']:.1f}" if 'peak_mb' in r else ''
+        rows = f"{r['rows']:,}" if r.get('rows') is not None else ''
+        lines.append(f"{name:<50} {r['wall_s']:>9.3f} {r['cpu_s']:>9.3f} {peak:>9} {rows:>10} {ratio:>8}")
+    return '\n'.join(lines)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description='benchmark the feature pipeline on synthetic data')
+    parser.add_argument('--data-dir', help='existing data dir; synthetic data is generated when omitted')
+    parser.add_argument('--scale', choices=list(SCALES), default='tiny')
+    parser.add_argument('--stage', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--only', help='run benchmarks whose name contains this')
+    parser.add_argument('--out', help='write results json here')
+    parser.add_argument('--save-baseline', help='write results as the baseline json')
+    parser.add_argument('--check', help='baseline json to compare against; exit 1 on regressions')
+    parser.add_argument('--time-tolerance', type=float, default=1.5)
+    parser.add_argument('--memory-tolerance', type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir
+    generated = data_dir is None
+    if generated:
+        data_dir = tempfile.mkdtemp(prefix='mm_bench_data_')
+        generate(data_dir, stage=args.stage, **SCALES[args.scale])
+    try:
+        results = run_benchmarks(data_dir, stage=args.stage, repeat=args.repeat, trace_memory=not args.no_memory, only=args.only)
+    finally:
+        if generated:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {'meta': {'scale': args.scale if generated else data_dir,
+                        'created': datetime.now().isoformat(timespec='seconds'),
+                        'python': platform.python_version(),
+                        'pandas': pd.__version__,
+                        'numpy': np.__version__,
+                        'machine': platform.machine()},
+            'results': results}
+    baseline = None
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+    print(format_table(results, baseline))
+    for path in [args.out, args.save_baseline]:
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=1)
+    if baseline is not None:
+        regressions = check_regressions(results, baseline, args.time_tolerance, args.memory_tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
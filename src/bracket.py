@@ -0,0 +1,142 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from matchups import season_matchups, parse_matchup_ids, unpack_matchup_key
+
+# tournament simulation: the 64 first round slots are laid out region by region (W, X, Y, Z) in bracket
+# order, so every round is "slot 2k plays slot 2k+1" and the final four pairs W/X and Y/Z like the kaggle
+# MNCAATourneySlots. all simulations advance one round at a time as (n_sims x slots) arrays.
+REGIONS = ['W', 'X', 'Y', 'Z']
+SEED_ORDER = [1, 16, 8, 9, 5, 12, 4, 13, 6, 11, 3, 14, 7, 10, 2, 15]
+ROUNDS = ['R0', 'R1', 'R2', 'R3', 'R4', 'R5', 'R6']
+ROUND_POINTS = (1, 2, 4, 8, 16, 32)
+
+
+def bracket_slots(seeds: pd.DataFrame):
+    """First round slots from one season's Seed strings ('W01', 'X16a', 'X16b').
+
+    Returns:
+        (list, np.ndarray): slot -> team ids, a 1 element list or a 2 element play-in; the team ids.
+    """
+    team_ids = np.sort(seeds['TeamID'].to_numpy(dtype=np.int64))
+    by_seed = {}
+    for seed, team in zip(seeds['Seed'], seeds['TeamID']):
+        by_seed.setdefault(seed[:3], []).append((seed[3:], int(team)))
+    slots = []
+    for region in REGIONS:
+        for s in SEED_ORDER:
+            teams = by_seed.get(f"{region}{s:02d}")
+            if not teams:
+                raise ValueError(f"no team seeded {region}{s:02d}")
+            slots.append([t for _, t in sorted(teams)])
+    return slots, team_ids
+
+
+def probability_matrix(team_ids: np.ndarray, predictions: pd.DataFrame) -> np.ndarray:
+    """Dense P[i, j] = P(team i beats team j) from matchup predictions.
+
+    predictions needs Pred (probability the lower id team wins) and either hTeamID/aTeamID or the kaggle ID.
+    Pairs without a prediction are 0.5.
+    """
+    if 'hTeamID' in predictions.columns:
+        h_team = predictions['hTeamID'].to_numpy(dtype=np.int64)
+        a_team = predictions['aTeamID'].to_numpy(dtype=np.int64)
+    else:
+        _, h_team, a_team = unpack_matchup_key(parse_matchup_ids(predictions['ID']))
+    pred = predictions['Pred'].to_numpy(dtype=np.float64)
+    h_pos = np.searchsorted(team_ids, h_team)
+    a_pos = np.searchsorted(team_ids, a_team)
+    known = (h_pos < len(team_ids)) & (a_pos < len(team_ids))
+    known[known] &= (team_ids[h_pos[known]] == h_team[known]) & (team_ids[a_pos[known]] == a_team[known])
+    P = np.full((len(team_ids), len(team_ids)), .5)
+    P[h_pos[known], a_pos[known]] = pred[known]
+    P[a_pos[known], h_pos[known]] = 1 - pred[known]
+    return P
+
+
+def _simulate_counts(P: np.ndarray, slots: list, n_sims: int, seed, batch_size: int = 25_000) -> np.ndarray:
+    """Counts of simulated tournaments where each team won round 0 (play-in) through 6."""
+    rng = np.random.default_rng(seed)
+    n_teams = P.shape[0]
+    # flat lookups P_flat[a*n + b] are cheaper than 2-D fancy indexing
+    P_flat = P.ravel()
+    counts = np.zeros((n_teams, len(ROUNDS)), dtype=np.int64)
+    fixed = np.array([i for i, s in enumerate(slots) if len(s) == 1], dtype=np.int64)
+    fixed_teams = np.array([slots[i][0] for i in fixed], dtype=np.int64)
+    play_in = np.array([i for i, s in enumerate(slots) if len(s) == 2], dtype=np.int64)
+    play_in_teams = np.array([slots[i] for i in play_in], dtype=np.int64).reshape(-1, 2)
+    done = 0
+    while done < n_sims:
+        batch = min(batch_size, n_sims - done)
+        state = np.empty((batch, len(slots)), dtype=np.intp)
+        state[:, fixed] = fixed_teams
+        counts[fixed_teams, 0] += batch
+        if len(play_in):
+            a = np.broadcast_to(play_in_teams[:, 0], (batch, len(play_in)))
+            b = np.broadcast_to(play_in_teams[:, 1], (batch, len(play_in)))
+            winners = np.where(rng.random(a.shape) < P_flat[a*n_teams + b], a, b)
+            state[:, play_in] = winners
+            counts[:, 0] += np.bincount(winners.ravel(), minlength=n_teams)
+        for r in range(1, len(ROUNDS)):
+            a = state[:, 0::2]
+            b = state[:, 1::2]
+            state = np.where(rng.random(a.shape) < P_flat[a*n_teams + b], a, b)
+            counts[:, r] += np.bincount(state.ravel(), minlength=n_teams)
+        done += batch
+    return counts
+
+
+class BracketSimulator(object):
+    def __init__(self, seeds_df: pd.DataFrame, season: int, predictions: pd.DataFrame):
+        """
+        Args:
+            seeds_df (pd.DataFrame): MNCAATourneySeeds.
+            season (int): tournament season.
+            predictions (pd.DataFrame): matchup_data rows with a Pred column (probability hTeamID wins),
+                or a submission frame (ID, Pred).
+        """
+        self.season = season
+        self.seeds = seeds_df.loc[seeds_df['Season'] == season, ['Seed', 'TeamID']].reset_index(drop=True)
+        slots, self.team_ids = bracket_slots(self.seeds)
+        # slots hold team positions in team_ids / P
+        self.slots = [np.searchsorted(self.team_ids, s).tolist() for s in slots]
+        self.P = probability_matrix(self.team_ids, predictions)
+
+    @classmethod
+    def from_scorer(cls, seeds_df: pd.DataFrame, season: int, scorer):
+        """Probabilities for every seeded pair from a scoring.MatchupScorer."""
+        games = season_matchups(seeds_df, seasons = season)
+        games['Pred'] = scorer.score_many(games[['Season', 'hTeamID', 'aTeamID']].to_numpy())
+        return cls(seeds_df, season, games)
+
+    def simulate(self, n_sims: int = 1_000_000, seed: int = None, n_workers: int = 1,
+                batch_size: int = 25_000) -> pd.DataFrame:
+        """Probability each team wins each round (R0 = play-in, always 1 for teams without one).
+
+        With n_workers > 1 the simulations are split across a process pool, each worker getting its own
+        child of np.random.SeedSequence(seed).
+        """
+        n_workers = max(1, min(n_workers or os.cpu_count(), n_sims))
+        seeds = np.random.SeedSequence(seed).spawn(n_workers)
+        chunks = [n_sims//n_workers + (i < n_sims % n_workers) for i in range(n_workers)]
+        if n_workers == 1:
+            counts = _simulate_counts(self.P, self.slots, n_sims, seeds[0], batch_size)
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                futures = [pool.submit(_simulate_counts, self.P, self.slots, c, s, batch_size) for c, s in zip(chunks, seeds)]
+                counts = sum(f.result() for f in futures)
+        advancement = pd.DataFrame(counts/n_sims, columns=ROUNDS)
+        advancement.insert(0, 'TeamID', self.team_ids)
+        advancement = self.seeds.merge(advancement, on = 'TeamID', how = 'left')
+        self.advancement = advancement.sort_values(['R6', 'R5', 'R4'], ascending = False).reset_index(drop=True)
+        return self.advancement
+
+    def expected_score(self, picks: dict, points: tuple = ROUND_POINTS, advancement: pd.DataFrame = None) -> float:
+        """Expected bracket score: picks maps round (1-6) to the TeamIDs picked to win that round."""
+        advancement = self.advancement if advancement is None else advancement
+        win_prob = advancement.set_index('TeamID')
+        total = 0.0
+        for r, teams in picks.items():
+            total += points[r - 1]*win_prob.loc[list(teams), ROUNDS[r]].sum()
+        return float(total)
@@ -0,0 +1,206 @@
+import os
+import time
+import shutil
+import tempfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# leave-one-season-out cv for the feature selection notebook. the head to head training matrix is loaded once,
+# written to .npy files and memory mapped by every worker (the pages are shared, nothing is pickled per task).
+# each (feature subset, holdout season) fit is one task on a process pool, with xgboost's own threads capped
+# per worker so n_workers * threads_per_worker matches the cores.
+NON_FEATURES = ['Season', 'hTeamID', 'aTeamID', 'ID', 'Y', 'MatchupKey']
+# our_xgb_model in the feature selection notebook
+DEFAULT_PARAMS = {'objective': 'binary:logistic',
+                  'eval_metric': 'logloss',
+                  'eta': .08,
+                  'min_child_weight': .3}
+DEFAULT_ROUNDS = 1000
+_worker = {}
+
+
+def log_loss(y: np.ndarray, p: np.ndarray, eps: float = 1e-15) -> float:
+    p = np.clip(np.asarray(p, dtype=np.float64), eps, 1 - eps)
+    y = np.asarray(y, dtype=np.float64)
+    return float(-np.mean(y*np.log(p) + (1 - y)*np.log(1 - p)))
+
+
+def _init_worker(paths: dict, nthread: int):
+    for name, path in paths.items():
+        _worker[name] = np.load(path, mmap_mode='r')
+    _worker['nthread'] = nthread
+
+
+def _fit_fold(subset: str, columns: np.ndarray, season: int, params: dict, n_rounds: int) -> dict:
+    import xgboost as xgb
+    X, y, seasons, nthread = _worker['X'], _worker['y'], _worker['season'], _worker['nthread']
+    test = np.flatnonzero(seasons == season)
+    train = np.flatnonzero(seasons != season)
+    start = time.perf_counter()
+    dtrain = xgb.DMatrix(X[np.ix_(train, columns)], label=y[train], nthread=nthread)
+    booster = xgb.train(dict(params, nthread=nthread), dtrain, num_boost_round=n_rounds)
+    preds = booster.inplace_predict(np.ascontiguousarray(X[np.ix_(test, columns)]))
+    return {'subset': subset, 'n_features': len(columns), 'season': season, 'n_train': len(train), 'n_test': len(test),
+            'log_loss': log_loss(y[test], preds), 'fit_s': time.perf_counter() - start}
+
+
+def _fit_importances(exclude_season: int, params: dict, n_rounds: int, importance_type: str) -> np.ndarray:
+    """Normalized importance of every column from one fit on every season but exclude_season."""
+    import xgboost as xgb
+    X, y, seasons, nthread = _worker['X'], _worker['y'], _worker['season'], _worker['nthread']
+    train = np.flatnonzero(seasons != exclude_season)
+    dtrain = xgb.DMatrix(X[train], label=y[train], nthread=nthread)
+    booster = xgb.train(dict(params, nthread=nthread), dtrain, num_boost_round=n_rounds)
+    scores = np.zeros(X.shape[1])
+    # unnamed DMatrix columns are f0, f1, ...
+    for name, score in booster.get_score(importance_type=importance_type).items():
+        scores[int(name[1:])] = score
+    return scores/scores.sum() if scores.sum() > 0 else scores
+
+
+class CVHarness(object):
+    def __init__(self, data, features: list = None, work_dir: str = None):
+        """
+        Args:
+            data (pd.DataFrame or str): head to head training data (e.g. model-dev/training/stats_data.csv) with
+                Season and Y. prediction rows (Y == -1) are dropped.
+            features (list, optional): feature columns. Defaults to everything but ids, Season and Y.
+            work_dir (str, optional): where the memory mapped arrays are written. Defaults to a temp dir,
+                removed by close().
+        """
+        df = pd.read_csv(data) if isinstance(data, str) else data
+        df = df.loc[df['Y'] != -1]
+        self.features = features or [c for c in df.columns if c not in NON_FEATURES]
+        self._own_dir = work_dir is None
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='cv_harness_')
+        os.makedirs(self.work_dir, exist_ok=True)
+        arrays = {'X': df[self.features].to_numpy(np.float32),
+                'y': df['Y'].to_numpy(np.float32),
+                'season': df['Season'].to_numpy(np.int64)}
+        self.paths = {}
+        for name, values in arrays.items():
+            self.paths[name] = os.path.join(self.work_dir, f"{name}.npy")
+            np.save(self.paths[name], values)
+        self.seasons = np.unique(arrays['season'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self._own_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _columns(self, features: list) -> np.ndarray:
+        missing = [f for f in features if f not in self.features]
+        if missing:
+            raise KeyError(f"not in the training matrix: {missing}")
+        return np.array([self.features.index(f) for f in features], dtype=np.intp)
+
+    def _map(self, func, tasks: list, n_workers: int, threads_per_worker: int) -> list:
+        n_workers = n_workers or max(1, (os.cpu_count() or 1)//threads_per_worker)
+        if n_workers == 1 or len(tasks) <= 1:
+            _init_worker(self.paths, threads_per_worker)
+            return [func(*task) for task in tasks]
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(tasks)), initializer=_init_worker,
+                                 initargs=(self.paths, threads_per_worker)) as pool:
+            futures = [pool.submit(func, *task) for task in tasks]
+            return [f.result() for f in futures]
+
+    def feature_importances(self, exclude_season: int = None, params: dict = None, n_rounds: int = DEFAULT_ROUNDS,
+                            nthread: int = None, importance_type: str = 'gain') -> pd.Series:
+        """Normalized importances from one fit on every season but exclude_season.
+
+        Subsets picked from importances fit on all seasons have seen every holdout's labels, so their
+        leave-one-season-out scores are optimistic; fold_importances / run_selection select inside each fold.
+        """
+        _init_worker(self.paths, nthread or os.cpu_count())
+        scores = _fit_importances(exclude_season, params or DEFAULT_PARAMS, n_rounds, importance_type)
+        scores = pd.Series(scores, index=self.features)
+        return scores.sort_values(ascending=False)
+
+    def fold_importances(self, seasons: list = None, params: dict = None, n_rounds: int = DEFAULT_ROUNDS,
+                         importance_type: str = 'gain', n_workers: int = None, threads_per_worker: int = 1) -> pd.DataFrame:
+        """Importances of each leave-one-season-out fold, fit on its training seasons only: one row per
+        holdout season, one column per feature."""
+        seasons = self.seasons if seasons is None else seasons
+        params = params or DEFAULT_PARAMS
+        tasks = [(int(season), params, n_rounds, importance_type) for season in seasons]
+        scores = self._map(_fit_importances, tasks, n_workers, threads_per_worker)
+        return pd.DataFrame(scores, index=pd.Index([int(s) for s in seasons], name='season'), columns=self.features)
+
+    @staticmethod
+    def threshold_subsets(importances: pd.Series, thresholds = None) -> dict:
+        """SelectFromModel style subsets: thresh -> features with importance >= thresh. Defaults to one
+        threshold per distinct importance. importances must not come from a fit on the seasons being scored."""
+        if thresholds is None:
+            thresholds = np.unique(importances[importances > 0])
+        return {f"thresh={t:.5f}": list(importances.index[importances >= t]) for t in thresholds}
+
+    def run(self, subsets: dict = None, seasons: list = None, params: dict = None, n_rounds: int = DEFAULT_ROUNDS,
+            n_workers: int = None, threads_per_worker: int = 1) -> pd.DataFrame:
+        """Leave-one-season-out log loss for every (subset, holdout season).
+
+        Args:
+            subsets (dict, optional): name -> feature list, the same for every fold. Defaults to {'all': every feature}.
+                Per fold selection (e.g. an importance threshold sweep) goes through run_selection.
+            seasons (list, optional): holdout seasons. Defaults to every season in the data.
+            params (dict, optional): xgboost params. Defaults to DEFAULT_PARAMS.
+            n_workers (int, optional): processes. Defaults to cpu count // threads_per_worker; 1 runs in process.
+            threads_per_worker (int, optional): xgboost nthread inside each worker.
+
+        Returns:
+            pd.DataFrame: subset, n_features, season, n_train, n_test, log_loss, fit_s.
+        """
+        subsets = subsets or {'all': self.features}
+        seasons = self.seasons if seasons is None else seasons
+        params = params or DEFAULT_PARAMS
+        tasks = [(name, self._columns(features), int(season), params, n_rounds)
+                for (name, features), season in itertools.product(subsets.items(), seasons)]
+        return pd.DataFrame(self._map(_fit_fold, tasks, n_workers, threads_per_worker))
+
+    def run_selection(self, thresholds: list = None, sizes: list = None, seasons: list = None, params: dict = None,
+                      n_rounds: int = DEFAULT_ROUNDS, importances: pd.DataFrame = None, n_workers: int = None,
+                      threads_per_worker: int = 1) -> pd.DataFrame:
+        """Importance based feature selection scored without leaking the holdout: each fold ranks the features
+        with a fit on its own training seasons, then every subset is fit and scored on the holdout.
+
+        Args:
+            thresholds (list, optional): keep features with importance >= thresh (subset 'thresh=...').
+            sizes (list, optional): keep the k most important features (subset 'top_k'). Defaults to every k
+                when thresholds is not given.
+            importances (pd.DataFrame, optional): fold_importances output, to reuse across sweeps.
+
+        Returns:
+            pd.DataFrame: as run(); n_features can differ between the folds of a threshold subset.
+        """
+        seasons = self.seasons if seasons is None else seasons
+        params = params or DEFAULT_PARAMS
+        if importances is None:
+            importances = self.fold_importances(seasons, params=params, n_rounds=n_rounds,
+                                                n_workers=n_workers, threads_per_worker=threads_per_worker)
+        if thresholds is None and sizes is None:
+            sizes = range(1, len(self.features) + 1)
+        tasks = []
+        for season in seasons:
+            ranked = importances.loc[int(season)].sort_values(ascending=False, kind='stable')
+            subsets = {f"thresh={t:.5f}": list(ranked.index[ranked >= t]) for t in (thresholds or [])}
+            subsets.update({f"top_{k}": list(ranked.index[:k]) for k in (sizes or [])})
+            tasks += [(name, self._columns(features), int(season), params, n_rounds)
+                      for name, features in subsets.items() if features]
+        return pd.DataFrame(self._map(_fit_fold, tasks, n_workers, threads_per_worker))
+
+    @staticmethod
+    def summary(results: pd.DataFrame) -> pd.DataFrame:
+        """Mean / worst fold log loss per subset, best first."""
+        return results.groupby('subset')\
+                    .agg(n_features = ('n_features', 'mean'), 
+                        mean = ('log_loss', 'mean'), 
+                        std = ('log_loss', 'std'), 
+                        max = ('log_loss', 'max')).reset_index()\
+                    .sort_values('mean').reset_index(drop=True)
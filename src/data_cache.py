@@ -0,0 +1,427 @@
+import os
+import json
+import shutil
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# raw kaggle csvs are converted once into a directory of .npy columns (one file per column + meta.json)
+# and reused while the source csv keeps the same size and mtime. filtered reads stream the csv and write the
+# copy chunk by chunk along the way, so the next process filters the binary columns. loaded frames are kept
+# in a shared in-process lru so every stage (and label_data) parses each file at most once per process.
+CACHE_DIR_NAME = '.raw_cache'
+META_FILE = 'meta.json'
+# under copy on write (always on from pandas 3) a shallow copy is enough to protect the cached frames
+COPY_ON_WRITE = int(pd.__version__.split('.')[0]) >= 3 or pd.get_option('mode.copy_on_write') is True
+
+
+class LRUCache(object):
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getstate__(self):
+        # cached values are not shipped to worker processes
+        return {'maxsize': self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxsize'])
+
+
+def _hand_out(df: pd.DataFrame) -> pd.DataFrame:
+    # shallow under copy on write: columns the caller adds or sets never reach the cached frame, and the
+    # ones it leaves alone stay memory mapped
+    return df.copy(deep=not COPY_ON_WRITE)
+
+
+def _save_array(path: str, values: np.ndarray):
+    # replaced rather than overwritten: frames loaded earlier may still map the old file
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, values)
+    os.replace(path + '.tmp', path)
+
+
+def save_frame(df: pd.DataFrame, frame_dir: str, extra_meta: dict = None):
+    """Write df as one .npy file per column; meta.json is written last so a partial write is never read."""
+    os.makedirs(frame_dir, exist_ok=True)
+    meta_path = os.path.join(frame_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    columns = []
+    for i, c in enumerate(df.columns):
+        col = df[c]
+        entry = {'name': c, 'file': f"{i}.npy"}
+        if pd.api.types.is_numeric_dtype(col.dtype) or pd.api.types.is_bool_dtype(col.dtype):
+            entry['kind'] = 'numeric'
+            values = col.to_numpy()
+        else:
+            entry['kind'] = 'string'
+            nulls = col.isna().to_numpy()
+            if nulls.any():
+                entry['mask'] = f"{i}_mask.npy"
+                _save_array(os.path.join(frame_dir, entry['mask']), nulls)
+            values = col.astype(str).to_numpy().astype('U')
+        _save_array(os.path.join(frame_dir, entry['file']), values)
+        columns.append(entry)
+    meta = {'rows': len(df), 'columns': columns}
+    if extra_meta:
+        meta.update(extra_meta)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def read_frame_meta(frame_dir: str):
+    meta_path = os.path.join(frame_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def load_frame(frame_dir: str, columns: list = None, meta: dict = None) -> pd.DataFrame:
+    """Load a frame written by save_frame. Numeric columns stay memory mapped (copy on write, so frames can
+    still be modified in memory); string columns are read into object arrays."""
+    meta = meta or read_frame_meta(frame_dir)
+    if meta is None:
+        return None
+    data = {}
+    for entry in meta['columns']:
+        if columns is not None and entry['name'] not in columns:
+            continue
+        values = np.load(os.path.join(frame_dir, entry['file']), mmap_mode='c')
+        if entry['kind'] == 'numeric':
+            data[entry['name']] = values
+        else:
+            values = values.astype(object)
+            if 'mask' in entry:
+                values[np.load(os.path.join(frame_dir, entry['mask']))] = np.nan
+            data[entry['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+class ChunkedFrameWriter(object):
+    def __init__(self, frame_dir: str, extra_meta: dict = None):
+        """save_frame for a frame streamed in chunks: every chunk is written as a part (save_frame layout) as it
+        arrives, and close() combines the parts into one .npy per column, copying a part at a time, so the
+        whole frame is never held in memory. meta.json is only written by close().
+
+        Args:
+            extra_meta (dict, optional): added to meta.json (e.g. the source csv signature).
+        """
+        self.frame_dir = frame_dir
+        self.extra_meta = extra_meta
+        self.parts_dir = os.path.join(frame_dir, 'parts')
+        self.parts = []
+        os.makedirs(frame_dir, exist_ok=True)
+        meta_path = os.path.join(frame_dir, META_FILE)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+    def write(self, chunk: pd.DataFrame):
+        part_dir = os.path.join(self.parts_dir, str(len(self.parts)))
+        save_frame(chunk, part_dir)
+        self.parts.append(part_dir)
+
+    def close(self):
+        metas = [read_frame_meta(part_dir) for part_dir in self.parts]
+        rows = sum(meta['rows'] for meta in metas)
+        columns = []
+        for i, name in enumerate(e['name'] for e in metas[0]['columns']):
+            pieces = [(part_dir, meta['rows'], meta['columns'][i]) for part_dir, meta in zip(self.parts, metas)]
+            entry = {'name': name, 'file': f"{i}.npy"}
+            # a column parsed as text in any chunk is text, numeric chunks take their common dtype
+            entry['kind'] = 'string' if any(e['kind'] == 'string' for _, _, e in pieces) else 'numeric'
+            arrays = [np.load(os.path.join(part_dir, e['file']), mmap_mode='r') for part_dir, _, e in pieces]
+            if entry['kind'] == 'string':
+                arrays = [a if a.dtype.kind == 'U' else a.astype('U') for a in arrays]
+                dtype = np.dtype(f"U{max(a.dtype.itemsize//4 for a in arrays)}")
+            else:
+                dtype = np.result_type(*arrays)
+            _concat_arrays(os.path.join(self.frame_dir, entry['file']), dtype, rows, arrays)
+            if any('mask' in e for _, _, e in pieces):
+                entry['mask'] = f"{i}_mask.npy"
+                masks = [np.load(os.path.join(part_dir, e['mask'])) if 'mask' in e else np.zeros(n, dtype=bool)
+                        for part_dir, n, e in pieces]
+                _concat_arrays(os.path.join(self.frame_dir, entry['mask']), np.dtype(bool), rows, masks)
+            columns.append(entry)
+        meta = {'rows': rows, 'columns': columns}
+        if self.extra_meta:
+            meta.update(self.extra_meta)
+        meta_path = os.path.join(self.frame_dir, META_FILE)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        self.abort()
+
+    def abort(self):
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+
+def _concat_arrays(path: str, dtype: np.dtype, rows: int, arrays: list):
+    out = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=dtype, shape=(rows,))
+    start = 0
+    for values in arrays:
+        out[start:start + len(values)] = values
+        start += len(values)
+    out.flush()
+    del out
+    os.replace(path + '.tmp', path)
+
+
+class RawDataCache(object):
+    def __init__(self, cache_dir: str = None, max_frames: int = 16):
+        """
+        Args:
+            cache_dir (str, optional): where binary copies are written. Defaults to a .raw_cache dir next to each csv.
+            max_frames (int, optional): number of parsed frames kept in memory.
+        """
+        self.cache_dir = cache_dir
+        self.frames = LRUCache(max_frames)
+        # one lock per file so concurrent stages asking for the same table parse it once
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'cache_dir': self.cache_dir, 'max_frames': self.frames.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['cache_dir'], state['max_frames'])
+
+    def _file_lock(self, csv_path: str):
+        with self._locks_lock:
+            return self._locks.setdefault(csv_path, threading.Lock())
+
+    def binary_dir(self, csv_path: str) -> str:
+        cache_dir = self.cache_dir or os.path.join(os.path.dirname(csv_path), CACHE_DIR_NAME)
+        return os.path.join(cache_dir, os.path.splitext(os.path.basename(csv_path))[0])
+
+    def read_csv(self, csv_path: str, copy: bool = True) -> pd.DataFrame:
+        csv_path = os.path.abspath(csv_path)
+        stat = os.stat(csv_path)
+        signature = {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+        key = (csv_path, stat.st_size, stat.st_mtime_ns)
+        df = self.frames.get(key)
+        if df is None:
+            with self._file_lock(csv_path):
+                df = self.frames.get(key)
+                if df is None:
+                    df = self._load_binary(csv_path, signature)
+                    if df is None:
+                        df = pd.read_csv(csv_path)
+                        self._save_binary(df, csv_path, signature)
+                    self.frames.put(key, df)
+        # stages add columns to the frames they get back, so hand out copies by default
+        return _hand_out(df) if copy else df
+
+    def read_filtered_csv(self, csv_path: str, isin: dict = None, between: dict = None, dtype: dict = None,
+                          chunksize: int = 1_000_000, copy: bool = True):
+        """Read only the rows passing the filters, without materializing the whole file. A csv read also writes
+        the binary copy, which later reads (in any process) filter instead.
+
+        Args:
+            isin (dict, optional): column -> allowed values.
+            between (dict, optional): column -> (low, high), inclusive.
+            dtype (dict, optional): column -> dtype applied to the kept rows ('category', 'int16', ...).
+            chunksize (int, optional): rows per chunk when streaming the csv.
+
+        Returns:
+            (pd.DataFrame, dict): kept rows and {'rows_scanned', 'rows_kept', 'source'}.
+        """
+        isin = {c: list(v) for c, v in (isin or {}).items()}
+        between = between or {}
+        dtype = dtype or {}
+        csv_path = os.path.abspath(csv_path)
+        stat = os.stat(csv_path)
+        signature = {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+        key = (csv_path, stat.st_size, stat.st_mtime_ns, 'filtered',
+               repr(sorted(isin.items())), repr(sorted(between.items())), repr(sorted(dtype.items())))
+        cached = self.frames.get(key)
+        if cached is None:
+            with self._file_lock(csv_path):
+                cached = self._read_filtered(csv_path, key, signature, isin, between, dtype, chunksize)
+        df, report = cached
+        return (_hand_out(df) if copy else df), dict(report)
+
+    def _read_filtered(self, csv_path, key, signature, isin, between, dtype, chunksize):
+        cached = self.frames.get(key)
+        if cached is None:
+            frame_dir = self.binary_dir(csv_path)
+            meta = read_frame_meta(frame_dir)
+            if meta is not None and all(meta.get(k) == v for k, v in signature.items()):
+                df, report = _filter_binary(frame_dir, meta, isin, between)
+            else:
+                df, report = _filter_csv_chunks(csv_path, isin, between, dtype, chunksize, 
+                                                self._chunk_writer(frame_dir, signature))
+            for c, t in dtype.items():
+                if c in df.columns:
+                    df[c] = df[c].astype(t)
+            cached = (df, report)
+            self.frames.put(key, cached)
+        return cached
+
+    def scan(self, csv_path: str, func, chunksize: int = 1_000_000):
+        """func(chunk) over every row of the file, a chunk at a time (e.g. digests of the massey ordinals): from the
+        binary copy when it is current, otherwise streamed from the csv while the binary copy is written, so the
+        reads that follow skip the csv."""
+        csv_path = os.path.abspath(csv_path)
+        stat = os.stat(csv_path)
+        signature = {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+        with self._file_lock(csv_path):
+            frame_dir = self.binary_dir(csv_path)
+            meta = read_frame_meta(frame_dir)
+            if meta is not None and all(meta.get(k) == v for k, v in signature.items()):
+                entries = {e['name']: e for e in meta['columns']}
+                for start in range(0, meta['rows'], chunksize):
+                    func(_take_rows(frame_dir, entries, slice(start, start + chunksize)))
+            else:
+                _stream_csv(csv_path, func, chunksize, self._chunk_writer(frame_dir, signature))
+
+    def derived(self, csv_path: str, name: str, build, copy: bool = True) -> pd.DataFrame:
+        """build(raw frame), computed once per version of the file and kept in the frame LRU next to it.
+
+        Args:
+            name (str): what build produces (e.g. 'team_games'), part of the cache key.
+            build (callable): raw frame -> derived frame. it gets the cached frame and must not modify it.
+        """
+        csv_path = os.path.abspath(csv_path)
+        stat = os.stat(csv_path)
+        key = (csv_path, stat.st_size, stat.st_mtime_ns, name)
+        df = self.frames.get(key)
+        if df is None:
+            with self._file_lock((csv_path, name)):
+                df = self.frames.get(key)
+                if df is None:
+                    df = build(self.read_csv(csv_path, copy=False))
+                    self.frames.put(key, df)
+        return _hand_out(df) if copy else df
+
+    def _load_binary(self, csv_path: str, signature: dict):
+        frame_dir = self.binary_dir(csv_path)
+        meta = read_frame_meta(frame_dir)
+        if meta is None or any(meta.get(k) != v for k, v in signature.items()):
+            return None
+        return load_frame(frame_dir, meta=meta)
+
+    def _chunk_writer(self, frame_dir: str, signature: dict):
+        try:
+            return ChunkedFrameWriter(frame_dir, extra_meta=signature)
+        except OSError:
+            return None
+
+    def _save_binary(self, df: pd.DataFrame, csv_path: str, signature: dict):
+        try:
+            save_frame(df, self.binary_dir(csv_path), extra_meta=signature)
+        except OSError:
+            # read only data dirs still get the in-memory cache
+            pass
+
+    def clear(self):
+        self.frames.clear()
+
+
+def _filter_mask(columns: dict, isin: dict, between: dict) -> np.ndarray:
+    mask = None
+    for c, values in isin.items():
+        m = np.isin(columns[c], values)
+        mask = m if mask is None else mask & m
+    for c, (low, high) in between.items():
+        m = (columns[c] >= low) & (columns[c] <= high)
+        mask = m if mask is None else mask & m
+    return mask
+
+
+def _stream_csv(csv_path: str, func, chunksize: int, writer: ChunkedFrameWriter = None) -> int:
+    # chunks are parsed with the default dtypes, so the binary copy written along the way (when writer is given)
+    # matches a full read
+    rows = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        rows += len(chunk)
+        if writer is not None:
+            try:
+                writer.write(chunk)
+            except OSError:
+                # read only data dirs still get the read
+                writer.abort()
+                writer = None
+        func(chunk)
+    if writer is not None:
+        try:
+            writer.close()
+        except OSError:
+            writer.abort()
+    return rows
+
+
+def _filter_csv_chunks(csv_path: str, isin: dict, between: dict, dtype: dict, chunksize: int,
+                       writer: ChunkedFrameWriter = None):
+    # the kept rows take dtype right away, categories are assigned after the chunks are combined so every
+    # chunk shares one set of categories
+    read_dtype = {c: t for c, t in dtype.items() if t != 'category'}
+    kept = []
+    def keep(chunk):
+        mask = _filter_mask({c: chunk[c].to_numpy() for c in chunk.columns}, isin, between)
+        part = chunk if mask is None else chunk.loc[mask]
+        kept.append(part.astype({c: t for c, t in read_dtype.items() if c in part.columns}))
+    rows_scanned = _stream_csv(csv_path, keep, chunksize, writer)
+    df = pd.concat(kept, ignore_index=True)
+    return df, {'rows_scanned': rows_scanned, 'rows_kept': len(df), 'source': 'csv'}
+
+
+def _take_rows(frame_dir: str, entries: dict, rows) -> pd.DataFrame:
+    # rows (positions or a slice) of every column, gathered from the memory maps
+    data = {}
+    for name, entry in entries.items():
+        values = np.load(os.path.join(frame_dir, entry['file']), mmap_mode='r')[rows]
+        if entry['kind'] == 'string':
+            values = values.astype(object)
+            if 'mask' in entry:
+                values[np.load(os.path.join(frame_dir, entry['mask']), mmap_mode='r')[rows]] = np.nan
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def _filter_binary(frame_dir: str, meta: dict, isin: dict, between: dict):
+    # only the filter columns are scanned, the rest are gathered from the memory map by position
+    filter_cols = set(isin) | set(between)
+    entries = {e['name']: e for e in meta['columns']}
+    scan = {c: np.load(os.path.join(frame_dir, entries[c]['file']), mmap_mode='r') for c in filter_cols}
+    mask = _filter_mask(scan, isin, between)
+    rows = np.arange(meta['rows']) if mask is None else np.flatnonzero(mask)
+    df = _take_rows(frame_dir, entries, rows)
+    return df, {'rows_scanned': meta['rows'], 'rows_kept': len(df), 'source': 'binary'}
+
+
+default_cache = RawDataCache()
+
+
+def read_raw_csv(csv_path: str, cache: RawDataCache = None, copy: bool = True) -> pd.DataFrame:
+    return (cache or default_cache).read_csv(csv_path, copy=copy)
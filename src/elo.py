@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+from matchups import pack_team_key, TEAM_BASE
+from as_of import DAY_BASE
+
+# elo ratings replayed over the full results history. games are processed one (Season, DayNum) at a time: every
+# game of the day reads the ratings going into the day and all updates land at once with np.add.at. ratings are
+# kept as (n_settings, n_teams), so any number of parameter settings (k factor, home edge, ...) share one replay.
+INITIAL_RATING = 1500.
+# k: update size, home: rating points added to the home team, regress: share of the distance to the
+# initial rating given back at each new season, mov: scale updates by the margin of victory
+DEFAULT_SETTING = {'k': 20., 'home': 100., 'regress': .25, 'mov': True}
+LOC_SIGN = {'H': 1, 'A': -1, 'N': 0}
+
+
+class EloRatings(object):
+    def __init__(self, games: pd.DataFrame, settings: list = None, score_from: int = None, initial: pd.DataFrame = None):
+        """
+        Args:
+            games (pd.DataFrame): W/L results (Season, DayNum, WTeamID, LTeamID, WScore, LScore, WLoc optional).
+            settings (list, optional): dicts overriding DEFAULT_SETTING, one set of ratings each. Defaults to [{}].
+            score_from (int, optional): first season counted in each setting's log loss. Defaults to the second
+                season, so the initial ratings get a season to settle.
+            initial (pd.DataFrame, optional): ratings at the end of the season before games (TeamID plus one column
+                per setting, as season_end_ratings returns), to resume a replay. regressed like any new season.
+        """
+        self.settings = pd.DataFrame([dict(DEFAULT_SETTING, **s) for s in (settings or [{}])])
+        df = games.sort_values(['Season', 'DayNum'], kind='stable')
+        n_games = len(df)
+        season = df['Season'].to_numpy(np.int64)
+        day = df['DayNum'].to_numpy(np.int64)
+        carried = np.zeros(0, dtype=np.int64) if initial is None else initial['TeamID'].to_numpy(np.int64)
+        self.team_ids = np.unique(np.r_[df['WTeamID'].to_numpy(), df['LTeamID'].to_numpy(), carried])
+        team = np.searchsorted(self.team_ids, np.r_[df['WTeamID'].to_numpy(), df['LTeamID'].to_numpy()])
+        w, l = team[:n_games], team[n_games:]
+        loc = df['WLoc'].map(LOC_SIGN).to_numpy(np.float64) if 'WLoc' in df.columns else np.zeros(n_games)
+        margin = (df['WScore'] - df['LScore']).to_numpy(np.float64)
+        k, home, regress = (self.settings[c].to_numpy(np.float64)[:, None] for c in ('k', 'home', 'regress'))
+        mov = self.settings['mov'].to_numpy(bool)[:, None]
+        self.seasons = np.unique(season)
+        score_from = self.seasons[min(1, len(self.seasons) - 1)] if score_from is None else score_from
+
+        R = np.full((len(self.settings), len(self.team_ids)), INITIAL_RATING)
+        if initial is not None:
+            R[:, np.searchsorted(self.team_ids, carried)] = initial[self._columns()].to_numpy(np.float64).T
+        # ratings going into and at the end of each season, and each side's rating after every game
+        self.preseason = np.empty((len(self.seasons), len(self.settings), len(self.team_ids)), dtype=np.float32)
+        self.season_end = np.empty((len(self.seasons), len(self.settings), len(self.team_ids)))
+        post = np.empty((len(self.settings), 2*n_games), dtype=np.float32)
+        loss = np.zeros(len(self.settings))
+        n_scored = 0
+        batch = season*DAY_BASE + day
+        starts = np.flatnonzero(np.r_[True, batch[1:] != batch[:-1]]) if n_games else np.zeros(0, dtype=np.intp)
+        ends = np.r_[starts[1:], n_games].astype(np.intp)
+        season_i = -1
+        for start, end in zip(starts, ends):
+            if season_i < 0 or season[start] != self.seasons[season_i]:
+                if season_i >= 0:
+                    self.season_end[season_i] = R
+                season_i += 1
+                if season_i or initial is not None:
+                    R -= regress*(R - INITIAL_RATING)
+                self.preseason[season_i] = R
+            ww, ll = w[start:end], l[start:end]
+            # winner's edge going into the day, home court included
+            diff = R[:, ww] - R[:, ll] + home*loc[start:end]
+            expected = 1/(1 + 10**(-diff/400))
+            mult = np.where(mov, np.log(margin[start:end] + 1)*2.2/(.001*diff + 2.2), 1)
+            delta = k*mult*(1 - expected)
+            if season[start] >= score_from:
+                loss -= np.log(expected).sum(axis=1)
+                n_scored += end - start
+            np.add.at(R.T, ww, delta.T)
+            np.add.at(R.T, ll, -delta.T)
+            post[:, start:end] = R[:, ww]
+            post[:, n_games + start:n_games + end] = R[:, ll]
+        if season_i >= 0:
+            self.season_end[season_i] = R
+        self.ratings = R
+        self.settings['log_loss'] = loss/max(n_scored, 1)
+
+        # team-game history sorted by (Season, TeamID, DayNum), for as of day lookups
+        keys = pack_team_key(np.r_[season, season], self.team_ids[team])*DAY_BASE + np.r_[day, day]
+        order = np.argsort(keys, kind='stable')
+        self._keys = keys[order]
+        self._post = post[:, order]
+        group_key = self._keys//DAY_BASE
+        self._starts = np.flatnonzero(np.r_[True, group_key[1:] != group_key[:-1]]) if len(group_key) else np.zeros(0, dtype=np.intp)
+        # packed Season/TeamID of every team-season played
+        self.team_seasons = group_key[self._starts]
+
+    def _columns(self) -> list:
+        return ['elo'] if len(self.settings) == 1 else [f"elo_{i}" for i in range(len(self.settings))]
+
+    def ratings_as_of(self, season = None, day_num: int = None) -> pd.DataFrame:
+        """Rating of every team playing in season going into day_num, one column per setting (elo, or elo_0,
+        elo_1, ... for several). Teams yet to play have their preseason rating.
+
+        Args:
+            season (int or list, optional): Defaults to every season.
+            day_num (int, optional): Defaults to the end of the season.
+        """
+        groups = np.arange(len(self.team_seasons))
+        if season is not None:
+            groups = groups[np.isin(self.team_seasons//TEAM_BASE, np.atleast_1d(season))]
+        keys = self.team_seasons[groups]
+        day_num = DAY_BASE - 1 if day_num is None else day_num
+        pos = np.searchsorted(self._keys, keys*DAY_BASE + day_num, side='left') - 1
+        played = pos >= self._starts[groups]
+        preseason = self.preseason[np.searchsorted(self.seasons, keys//TEAM_BASE), :,
+                                   np.searchsorted(self.team_ids, keys % TEAM_BASE)]
+        values = np.where(played[:, None], self._post[:, np.maximum(pos, 0)].T, preseason)
+        ratings = pd.DataFrame(values.astype(np.float64), columns=self._columns())
+        ratings.insert(0, 'Season', keys//TEAM_BASE)
+        ratings.insert(1, 'TeamID', keys % TEAM_BASE)
+        return ratings
+
+    def season_end_ratings(self) -> pd.DataFrame:
+        """Rating of every team at the end of each season (Season, TeamID, one column per setting), in float64 so
+        a replay resumed from a season's rows (initial) matches the full one."""
+        n_teams = len(self.team_ids)
+        values = self.season_end.transpose(0, 2, 1).reshape(-1, len(self.settings))
+        ratings = pd.DataFrame(values, columns=self._columns())
+        ratings.insert(0, 'Season', np.repeat(self.seasons, n_teams))
+        ratings.insert(1, 'TeamID', np.tile(self.team_ids, len(self.seasons)))
+        return ratings
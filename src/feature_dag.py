@@ -0,0 +1,98 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pandas as pd
+import instrumentation
+from instrumentation import instrumented
+
+# feature stages are independent functions returning (frame, fill): a standalone frame keyed by
+# Season/TeamID plus the fill value(s) for its columns. stages run concurrently and are joined onto
+# the team spine in one multi-way index join, with each stage's fill applied afterwards. a stage can return
+# a third item, its state per season (e.g. elo ratings at each season end), which the feature store keeps
+# so a later partial rebuild resumes from it instead of replaying the full history.
+KEYS = ['Season', 'TeamID']
+
+
+class FeatureStage(object):
+    def __init__(self, name: str, func, inputs: list = (), columns: list = (), carries_forward: bool = False):
+        """
+        Args:
+            name (str): stage name.
+            func (callable): no-arg callable returning (frame, fill) or (frame, fill, state). fill is a scalar or a
+                {column: value} dict, state a frame with a Season column.
+            inputs (list, optional): raw tables the stage reads.
+            columns (list, optional): feature columns the stage must produce.
+            carries_forward (bool, optional): a season's features depend on the earlier seasons of the inputs too
+                (cumulative records, ratings), so a change to an input season dirties every later season.
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.columns = list(columns)
+        self.carries_forward = carries_forward
+
+    def __repr__(self):
+        return f"FeatureStage({self.name})"
+
+
+@instrumented()
+def run_stages(stages: list, spine: pd.DataFrame, max_workers: int = None, executor: str = 'thread',
+               fills: dict = None, state: dict = None, filled: dict = None) -> pd.DataFrame:
+    """Run stages (executor = 'thread', 'process' or 'serial') and join their frames onto the spine.
+    The dicts passed in record, by stage name, each stage's fill value (fills), the state it returned (state)
+    and the seasons where a row took its fill (filled)."""
+    inst = instrumentation.active()
+    if inst is not None:
+        # per stage memory peaks and timings are only meaningful one stage at a time, and records made in
+        # worker processes never reach the parent, so instrumented runs go serial
+        inst.note(executor = f"serial (asked for {executor})")
+        executor = 'serial'
+    if executor == 'serial' or len(stages) <= 1:
+        results = [stage.func() for stage in stages]
+    else:
+        pool_cls = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+        with pool_cls(max_workers=max_workers or len(stages)) as pool:
+            futures = [pool.submit(stage.func) for stage in stages]
+            results = [f.result() for f in futures]
+    return join_stage_frames(spine, stages, results, fills=fills, state=state, filled=filled)
+
+
+@instrumented()
+def join_stage_frames(spine: pd.DataFrame, stages: list, results: list, fills: dict = None, state: dict = None,
+                      filled: dict = None) -> pd.DataFrame:
+    frames = []
+    stage_fills = []
+    duplicates = {}
+    for stage, result in zip(stages, results):
+        frame, fill = result[:2]
+        if state is not None and len(result) > 2:
+            state[stage.name] = result[2]
+        missing = [c for c in stage.columns if c not in frame.columns]
+        if missing:
+            raise ValueError(f"stage {stage.name} did not produce {missing}")
+        frame = frame.astype({k: 'int64' for k in KEYS}).set_index(KEYS)
+        # one row per team season, otherwise the join multiplies spine rows
+        duplicated = frame.index.duplicated(keep='last')
+        if duplicated.any():
+            frame = frame.loc[~duplicated]
+            duplicates[stage.name] = int(duplicated.sum())
+        frames.append(frame)
+        stage_fills.append(fill)
+        if fills is not None:
+            fills[stage.name] = fill
+    joined = spine.astype({k: 'int64' for k in KEYS}).set_index(KEYS)
+    if frames:
+        joined = joined.join(frames, how='left')
+    inst = instrumentation.active()
+    null_fills = {}
+    for stage, frame, fill in zip(stages, frames, stage_fills):
+        cols = list(frame.columns)
+        nulls = joined[cols].isna()
+        if filled is not None:
+            seasons = joined.index.get_level_values('Season')[nulls.any(axis=1).to_numpy()]
+            filled[stage.name] = sorted(int(s) for s in seasons.unique())
+        if inst is not None:
+            null_fills[stage.name] = int(nulls.sum().sum())
+            inst.count_fills(null_fills[stage.name])
+        joined[cols] = joined[cols].fillna(fill)
+    if inst is not None:
+        inst.note(duplicate_keys = duplicates, null_fills_by_stage = null_fills)
+    return joined.reset_index()
@@ -0,0 +1,196 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from data_cache import RawDataCache, default_cache, save_frame, load_frame, read_frame_meta
+from raw_features import RawFeatures
+
+# feature sets persisted as <store_dir>/<type>/season=<YYYY>/ partitions plus a manifest holding,
+# per raw table, the file signature and a digest of each season's rows. a refresh only rebuilds
+# the seasons whose raw rows changed, so a daily tournament update only touches the current season.
+# the stages' state per season (elo ratings, cumulative coach records, fill aggregates) is kept under
+# <type>/state/<stage>/, so the rebuilt seasons resume from it rather than replaying the full history.
+MANIFEST_FILE = 'manifest.json'
+STATE_DIR = 'state'
+
+
+def season_digests(df: pd.DataFrame, sums: dict = None) -> dict:
+    """Order independent digest of each season's rows ({season: sum of row hashes mod 2**64}). Numbers are hashed as
+    float64 and everything else as str, so a frame read in chunks digests like the whole frame.
+
+    Args:
+        sums (dict, optional): running {season: int} sums to add df to (see csv_season_digests).
+    """
+    sums = {} if sums is None else sums
+    if len(df):
+        normalized = pd.DataFrame({c: df[c].astype(np.float64) if pd.api.types.is_numeric_dtype(df[c].dtype) else df[c].astype(str)
+                                    for c in df.columns})
+        row_hash = pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+        season = df['Season'].to_numpy()
+        order = np.argsort(season, kind='stable')
+        season = season[order]
+        starts = np.flatnonzero(np.r_[True, season[1:] != season[:-1]])
+        for s, h in zip(season[starts], np.add.reduceat(row_hash[order], starts)):
+            sums[int(s)] = (sums.get(int(s), 0) + int(h)) % 2**64
+    return sums
+
+
+def csv_season_digests(csv_path: str, chunksize: int = 1_000_000, cache: RawDataCache = None) -> dict:
+    # a chunk at a time, so digesting the massey ordinals never holds the whole file. a changed csv is parsed
+    # once, here: the binary copy written along the way serves the rebuild's reads
+    sums = {}
+    (cache or default_cache).scan(csv_path, lambda chunk: season_digests(chunk, sums), chunksize=chunksize)
+    return {str(s): format(h, '016x') for s, h in sorted(sums.items())}
+
+
+def stage_schema(raw_features: RawFeatures, type = 'stats') -> dict:
+    return {stage.name: stage.columns for stage in raw_features.stages(type)}
+
+
+class FeatureStore(object):
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+
+    def type_dir(self, type):
+        return os.path.join(self.store_dir, type)
+
+    def partition_dir(self, type, season):
+        return os.path.join(self.type_dir(type), f"season={season}")
+
+    def state_dir(self, type, stage = None):
+        state_dir = os.path.join(self.type_dir(type), STATE_DIR)
+        return state_dir if stage is None else os.path.join(state_dir, stage)
+
+    def load_state(self, type) -> dict:
+        """{stage: state frame} saved by the last build, None for a store without any."""
+        stages = self.read_manifest(type).get('state')
+        if stages is None:
+            return None
+        return {stage: load_frame(self.state_dir(type, stage)) for stage in stages}
+
+    def filled_stages(self, type, season) -> set:
+        """Stages whose fill some row of the season's partition took (None if not recorded)."""
+        meta = read_frame_meta(self.partition_dir(type, season))
+        if meta is None:
+            return set()
+        return None if meta.get('filled') is None else set(meta['filled'])
+
+    def read_manifest(self, type) -> dict:
+        path = os.path.join(self.type_dir(type), MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {'tables': {}, 'seasons': []}
+        with open(path) as f:
+            return json.load(f)
+
+    def write_manifest(self, type, manifest: dict):
+        path = os.path.join(self.type_dir(type), MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(path + '.tmp', path)
+
+    def dirty_seasons(self, raw_features: RawFeatures, type = 'stats', force = False):
+        """Seasons that need rebuilding, and the table state to record once they are rebuilt."""
+        min_year, max_year = raw_features.season_range(type)
+        all_seasons = set(range(min_year, max_year + 1))
+        manifest = self.read_manifest(type)
+        dirty = set() if not force else set(all_seasons)
+        dirty |= all_seasons - set(manifest['seasons'])
+        # a stage added or changed since the partitions were written leaves them all stale
+        if manifest.get('stages') != stage_schema(raw_features, type):
+            dirty |= all_seasons
+        tables = {}
+        for table, carries_forward in raw_features.input_tables(type).items():
+            stat = os.stat(raw_features.raw_data_path(table))
+            previous = manifest['tables'].get(table, {})
+            if previous.get('source_size') == stat.st_size and previous.get('source_mtime_ns') == stat.st_mtime_ns:
+                tables[table] = previous
+                continue
+            digests = csv_season_digests(raw_features.raw_data_path(table), cache=raw_features.cache)
+            old_digests = previous.get('seasons', {})
+            changed = {int(s) for s in set(digests) | set(old_digests) if digests.get(s) != old_digests.get(s)}
+            if carries_forward and changed:
+                changed |= {s for s in all_seasons if s > min(changed)}
+            # seasons outside the feature set are kept too: the stage states cover them (see refresh)
+            dirty |= changed
+            tables[table] = {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns, 'seasons': digests}
+        return sorted(dirty), tables
+
+    def refresh(self, raw_features: RawFeatures, type = 'stats', force = False) -> pd.DataFrame:
+        """Rebuild the changed season partitions of a feature set and return the full set.
+
+        The rebuilt seasons resume cross season state (coach_exp's cumulative records, elo) and the stage fill
+        values (e.g. the average oppg given to missing teams, a mean over every season) from the stored stage
+        state, so a partial rebuild matches a full one. A store without state, a change outside the feature
+        set's seasons or every season being dirty builds the whole set from scratch. When new data moves a
+        stage's fill, the clean partitions where a row took that fill are rebuilt as well.
+        """
+        dirty, tables = self.dirty_seasons(raw_features, type, force=force)
+        os.makedirs(self.type_dir(type), exist_ok=True)
+        manifest = self.read_manifest(type)
+        min_year, max_year = raw_features.season_range(type)
+        all_seasons = set(range(min_year, max_year + 1))
+        if dirty:
+            full = 'state' not in manifest or all_seasons <= set(dirty) or not set(dirty) <= all_seasons
+            fills = self._rebuild(raw_features, type, None if full else dirty)
+            if full:
+                dirty = sorted(all_seasons)
+            else:
+                moved = {stage for stage, fill in fills.items() if fill != manifest.get('fills', {}).get(stage)}
+                stale = []
+                for season in manifest['seasons']:
+                    if min_year <= season <= max_year and season not in dirty and moved:
+                        filled = self.filled_stages(type, season)
+                        if filled is None or filled & moved:
+                            stale.append(season)
+                if stale:
+                    self._rebuild(raw_features, type, stale)
+                    dirty = sorted(set(dirty) | set(stale))
+            manifest['fills'] = fills
+            manifest['state'] = sorted(raw_features.state)
+        manifest['seasons'] = sorted(set(manifest['seasons']) | set(dirty))
+        manifest['seasons'] = [s for s in manifest['seasons'] if min_year <= s <= max_year]
+        manifest['tables'] = tables
+        manifest['stages'] = stage_schema(raw_features, type)
+        self.write_manifest(type, manifest)
+        self.last_refresh = dirty
+        return self.load(type)
+
+    def _rebuild(self, raw_features: RawFeatures, type, seasons: list = None) -> dict:
+        """Rebuild and save the partitions of seasons (None: every season, from scratch) and the stage states,
+        returning the fills used (as stored in the manifest). Each partition records the stages whose fill it took."""
+        raw_features.seasons = seasons
+        raw_features.prior_state = None if seasons is None else self.load_state(type)
+        try:
+            feature_set = raw_features.build_feature_set(type=type, save=False)
+        finally:
+            raw_features.seasons = None
+            raw_features.prior_state = None
+        if seasons is None:
+            min_year, max_year = raw_features.season_range(type)
+            seasons = range(min_year, max_year + 1)
+            shutil.rmtree(self.state_dir(type), ignore_errors=True)
+        for season in seasons:
+            partition = self.partition_dir(type, season)
+            rows = feature_set.loc[feature_set['Season'] == season]
+            if len(rows):
+                filled = [stage for stage, filled_seasons in raw_features.filled.items() if season in filled_seasons]
+                save_frame(rows.reset_index(drop=True), partition, extra_meta={'filled': filled})
+            elif os.path.exists(partition):
+                shutil.rmtree(partition)
+        for stage, state in raw_features.state.items():
+            save_frame(state.reset_index(drop=True), self.state_dir(type, stage))
+        return json.loads(json.dumps(raw_features.fills, default=float))
+
+    def load(self, type = 'stats', seasons = None) -> pd.DataFrame:
+        manifest = self.read_manifest(type)
+        frames = []
+        for season in manifest['seasons']:
+            if seasons is not None and season not in seasons:
+                continue
+            partition = self.partition_dir(type, season)
+            if os.path.exists(partition):
+                frames.append(load_frame(partition))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
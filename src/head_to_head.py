@@ -1,33 +1,120 @@
-import pandas as pd 
+import pandas as pd
 from math import log, exp
-import numpy as np 
+import numpy as np
+from matchups import pack_team_key
+from instrumentation import instrumented
 
 # data sets needed
-# training: 1. stats 2. rankings 
-# prediction: 1. stats 2. rankings 
-# Note add in feature: expected score here 
-def build_head_to_head(df: pd.DataFrame, 
-                        features_df: pd.DataFrame = None):
-    
-    feature_names = [c for c in features_df.columns if c not in ['Season', 'TeamID', 'year_trend']]
-    rename_dict = {}
-    for f in feature_names:
-        rename_dict[f] = f"h{f}"
-    games_df = pd.merge(df, features_df, left_on = ['Season', 'hTeamID'], right_on = ['Season', 'TeamID'], how = 'left')
-    games_df.rename(columns = rename_dict, inplace=True)
-    rename_dict = {}
-    for f in feature_names:
-        rename_dict[f] = f"a{f}" 
-    games_df = pd.merge(df, features_df, left_on = ['Season', 'aTeamID'], right_on = ['Season', 'TeamID'], how = 'left')
-    games_df.rename(columns = rename_dict, inplace=True)
-    
-    # difference features 
-    for feat in feature_names:
-        games_df[f"{feat}_diff"] = games_df[f"h{feat}"] - games_df[f"a{feat}"] 
-        try:
-            games_df[f"{feat}_ratio"] = games_df[f"h{feat}"]/games_df[f"a{feat}"] 
-        except ZeroDivisionError:
-            games_df[f"{feat}_ratio"] = games_df[f"h{feat}"]
-
-    return games_df 
- 
+# training: 1. stats 2. rankings
+# prediction: 1. stats 2. rankings
+# Note add in feature: expected score here
+NON_FEATURES = ['Season', 'TeamID', 'year_trend']
+DERIVED = ('diff', 'ratio')
+
+
+def safe_ratio(h: np.ndarray, a: np.ndarray) -> np.ndarray:
+    # h/a, falling back to h where a is 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.divide(h, a, out=h.copy(), where=a != 0)
+
+
+class TeamSeasonIndex(object):
+    def __init__(self, features_df: pd.DataFrame, feature_names: list = None, dtype = np.float32):
+        """Team season features as one dense 2-D array, rows found by packed (Season, TeamID) key.
+
+        Args:
+            features_df (pd.DataFrame): one row per Season/TeamID (a raw feature set).
+            feature_names (list, optional): columns to index. Defaults to everything but Season/TeamID/year_trend.
+        """
+        self.feature_names = list(feature_names) if feature_names is not None else \
+                                [c for c in features_df.columns if c not in NON_FEATURES]
+        keys = pack_team_key(features_df['Season'].to_numpy(), features_df['TeamID'].to_numpy())
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        # duplicated team seasons keep their last row
+        keep = np.r_[keys[1:] != keys[:-1], True] if len(keys) else np.zeros(0, dtype=bool)
+        self.keys = keys[keep]
+        values = features_df[self.feature_names].to_numpy(dtype=dtype)[order[keep]]
+        # trailing all-nan row, gathered for teams that are not in the index
+        self.values = np.vstack([values, np.full((1, len(self.feature_names)), np.nan, dtype=dtype)])
+        self.year_trend = None
+        if 'year_trend' in features_df.columns:
+            self.year_trend = np.r_[features_df['year_trend'].to_numpy(dtype=np.float64)[order[keep]], np.nan]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions(self, season, team) -> np.ndarray:
+        """Row of each (season, team); -1 (the nan row) when missing."""
+        keys = pack_team_key(season, team)
+        if len(self.keys) == 0:
+            return np.full(keys.shape, -1)
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[pos] == keys, pos, -1)
+
+    def feature_positions(self, features: list = None) -> np.ndarray:
+        if features is None:
+            return np.arange(len(self.feature_names))
+        lookup = {f: i for i, f in enumerate(self.feature_names)}
+        return np.array([lookup[f] for f in features], dtype=np.int64)
+
+
+@instrumented()
+def head_to_head_matrix(df: pd.DataFrame,
+                        features_df: pd.DataFrame = None,
+                        features: list = None,
+                        derived: tuple = DERIVED,
+                        include_teams: bool = True,
+                        dtype = np.float32,
+                        index: TeamSeasonIndex = None):
+    """Home/away features plus diffs and ratios for every game in df (Season, hTeamID, aTeamID).
+
+    Ratios where the away value is 0 fall back to the home value.
+
+    Returns:
+        (np.ndarray, list): C-contiguous (games x columns) matrix and its column names.
+    """
+    if index is None:
+        index = TeamSeasonIndex(features_df, dtype=dtype)
+    cols = index.feature_positions(features)
+    names = [index.feature_names[i] for i in cols]
+    season = df['Season'].to_numpy()
+    h_rows = index.positions(season, df['hTeamID'].to_numpy())
+    a_rows = index.positions(season, df['aTeamID'].to_numpy())
+    h = index.values[np.ix_(h_rows, cols)]
+    a = index.values[np.ix_(a_rows, cols)]
+
+    blocks = []
+    column_names = []
+    if include_teams:
+        blocks += [h, a]
+        column_names += [f"h{f}" for f in names] + [f"a{f}" for f in names]
+    for d in derived:
+        if d == 'diff':
+            blocks.append(np.subtract(h, a))
+        elif d == 'ratio':
+            blocks.append(safe_ratio(h, a))
+        else:
+            raise ValueError(f"unknown derived feature {d}")
+        column_names += [f"{f}_{d}" for f in names]
+
+    out = np.empty((len(df), len(column_names)), dtype=dtype)
+    start = 0
+    for block in blocks:
+        out[:, start:start + block.shape[1]] = block
+        start += block.shape[1]
+    return out, column_names
+
+
+@instrumented()
+def build_head_to_head(df: pd.DataFrame,
+                        features_df: pd.DataFrame = None,
+                        features: list = None,
+                        derived: tuple = DERIVED,
+                        dtype = np.float64):
+    index = TeamSeasonIndex(features_df, dtype=dtype)
+    matrix, column_names = head_to_head_matrix(df, features=features, derived=derived, dtype=dtype, index=index)
+    games_df = df.reset_index(drop=True)
+    if index.year_trend is not None:
+        games_df = games_df.assign(year_trend = index.year_trend[index.positions(df['Season'].to_numpy(), df['hTeamID'].to_numpy())])
+    return pd.concat([games_df, pd.DataFrame(matrix, columns=column_names, copy=False)], axis=1)
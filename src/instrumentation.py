@@ -0,0 +1,178 @@
+import json
+import time
+import inspect
+import threading
+import tracemalloc
+import functools
+from datetime import datetime
+import pandas as pd
+
+# opt-in per stage instrumentation. decorated functions check one module global and call straight through
+# when no Instrumentation is active; inside `with Instrumentation() as inst:` every decorated call records
+# wall/cpu time, traced peak memory, input/output shapes and the nulls filled by fillna().
+# tracemalloc is process wide, so feature_dag.run_stages runs its stages serially while instrumentation is
+# active; cpu time is the calling thread's.
+_active = None
+
+
+def active():
+    return _active
+
+
+def _shape(obj):
+    # stages return (frame, fill), head_to_head_matrix returns (matrix, names)
+    if isinstance(obj, tuple) and obj:
+        obj = obj[0]
+    if isinstance(obj, pd.DataFrame):
+        return obj.shape
+    if hasattr(obj, 'shape') and len(getattr(obj, 'shape')) == 2:
+        return tuple(obj.shape)
+    return None
+
+
+class Instrumentation(object):
+    def __init__(self, trace_memory: bool = True, run_id: str = None):
+        """
+        Args:
+            trace_memory (bool, optional): track peak memory with tracemalloc (slows python allocations down).
+            run_id (str, optional): tag written on every record. Defaults to the start time.
+        """
+        self.trace_memory = trace_memory
+        self.run_id = run_id or datetime.now().isoformat(timespec='seconds')
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracing = False
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc):
+        self.disable()
+        return False
+
+    def enable(self):
+        global _active
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        _active = self
+        return self
+
+    def disable(self):
+        global _active
+        _active = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def start(self, name: str, inputs: list = ()) -> dict:
+        stack = self._stack()
+        record = {'run_id': self.run_id, 'stage': name, 'depth': len(stack), 'thread': threading.current_thread().name,
+                'rows_in': sum(s[0] for s in inputs) if inputs else None,
+                'cols_in': max(s[1] for s in inputs) if inputs else None,
+                'null_fills': 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # the parent keeps its own peak before this stage resets the counter
+            if stack:
+                stack[-1]['_peak'] = max(stack[-1]['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_mem_start'] = current
+            record['_peak'] = current
+        record['_wall'] = time.perf_counter()
+        record['_cpu'] = time.thread_time()
+        stack.append(record)
+        return record
+
+    def stop(self, record: dict, output = None):
+        record['wall_s'] = time.perf_counter() - record.pop('_wall')
+        record['cpu_s'] = time.thread_time() - record.pop('_cpu')
+        stack = self._stack()
+        stack.pop()
+        if self.trace_memory:
+            peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = (peak - record.pop('_mem_start'))/2**20
+            if stack:
+                stack[-1]['_peak'] = max(stack[-1]['_peak'], peak)
+        shape = _shape(output)
+        record['rows_out'], record['cols_out'] = shape if shape else (None, None)
+        if stack:
+            stack[-1]['null_fills'] += record['null_fills']
+        with self._lock:
+            self.records.append(record)
+
+    def count_fills(self, n: int):
+        stack = self._stack()
+        if stack:
+            stack[-1]['null_fills'] += int(n)
+
+    def note(self, **info):
+        """Attach extra fields (e.g. duplicate key counts) to the innermost running stage."""
+        stack = self._stack()
+        if stack:
+            stack[-1].update(info)
+
+    def report(self) -> list:
+        return [{k: v for k, v in r.items()} for r in self.records]
+
+    def write_jsonl(self, path: str):
+        with open(path, 'a') as f:
+            for record in self.records:
+                f.write(json.dumps(record, default=str) + '\n')
+
+    def summary(self) -> str:
+        """One line per stage, in the order the stages finished (children before their parents)."""
+        lines = [f"{'stage':<60} {'wall_s':>8} {'cpu_s':>8} {'peak_mb':>8} {'rows_in':>10} {'rows_out':>10} {'cols':>5} {'fills':>8}"]
+        for r in self.records:
+            fmt = lambda v, spec: format(v, spec) if v is not None else ''
+            name = '  '*r['depth'] + r['stage']
+            lines.append(f"{name:<60} {r['wall_s']:>8.3f} {r['cpu_s']:>8.3f} {fmt(r.get('peak_mb'), '.1f'):>8} "
+                        f"{fmt(r['rows_in'], ','):>10} {fmt(r['rows_out'], ','):>10} {fmt(r['cols_out'], ''):>5} {r['null_fills']:>8,}")
+        return '\n'.join(lines)
+
+
+def instrumented(name: str = None, detail: str = None):
+    """Decorator recording a call as a stage when instrumentation is active.
+
+    Args:
+        name (str, optional): stage name. Defaults to the function's qualified name.
+        detail (str, optional): argument whose value is appended to the name (e.g. raw_df_name).
+    """
+    def decorator(func):
+        stage_name = name or func.__qualname__
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            inst = _active
+            if inst is None:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            label = stage_name
+            if detail is not None:
+                bound.apply_defaults()
+                label = f"{stage_name}:{bound.arguments.get(detail)}"
+            inputs = [s for s in (_shape(v) for v in bound.arguments.values() if isinstance(v, pd.DataFrame)) if s]
+            record = inst.start(label, inputs)
+            output = None
+            try:
+                output = func(*args, **kwargs)
+                return output
+            finally:
+                inst.stop(record, output)
+        return wrapper
+    return decorator
+
+
+def fillna(df, value):
+    """df.fillna(value), counting the filled nulls when instrumentation is active."""
+    inst = _active
+    if inst is not None:
+        inst.count_fills(df.isna().sum().sum())
+    return df.fillna(value)
@@ -1,39 +1,27 @@
 import pandas as pd
 from math import exp, log
-import numpy as np 
-from itertools import product
+import numpy as np
+from data_cache import read_raw_csv
+from matchups import label_games, season_matchups, matchup_ids
+from instrumentation import instrumented
 
-# need ID (Season_hTeamID_lTeamID), hTeamID, lTeamID, Season, y 
-def build_labelled_data(raw_df_path = '/Users/philazar/Desktop/march-madness/data/data-2022/MDataFiles_Stage1/MNCAATourneyCompactResults.csv'):
-    df = pd.read_csv(raw_df_path)
-    df['WTeamID'] = df['WTeamID'].astype(int)
-    df['LTeamID'] = df['LTeamID'].astype(int)
-    df_pos_class = df.loc[df['WTeamID'] < df['LTeamID'], :].copy()
-    df_pos_class['hTeamID'] = df_pos_class['WTeamID']
-    df_pos_class['aTeamID'] = df_pos_class['LTeamID'] 
-    df_pos_class['Y'] = 1.0
-
-    df_min_class = df.loc[df['WTeamID'] > df['LTeamID'], :].copy()
-    df_min_class['hTeamID'] = df_min_class['LTeamID']
-    df_min_class['aTeamID'] = df_min_class['WTeamID'] 
-    df_min_class.loc[:, 'Y'] = 0.0
-    df = pd.concat([df_min_class, df_pos_class])
-    df['aTeamID'] = df['aTeamID'].astype(int)
-    df['hTeamID'] =df['hTeamID'].astype(int)  
-    df['ID'] = df.apply(lambda x: '%s_%s_%s' % (str(x['Season']),str(x['hTeamID']),str(x['aTeamID'])),axis=1)
+# need ID (Season_hTeamID_lTeamID), hTeamID, lTeamID, Season, y
+# MatchupKey is the packed int64 version of ID, with_id = False skips building the strings
+@instrumented()
+def build_labelled_data(raw_df_path = '/Users/philazar/Desktop/march-madness/data/data-2022/MDataFiles_Stage1/MNCAATourneyCompactResults.csv',
+                        with_id = True):
+    df = label_games(read_raw_csv(raw_df_path))
+    if with_id:
+        df['ID'] = matchup_ids(df['MatchupKey']).to_numpy()
     return df
 
+@instrumented()
 def matchup_data(raw_df_path = '/Users/philazar/Desktop/march-madness/data/data-2022/MDataFiles_Stage1/MNCAATourneySeeds.csv',
-                season= 2021):
-    df = pd.read_csv(raw_df_path)
-    df = df.loc[df['Season'] == season][['Season', 'TeamID']]
-    teams = df.TeamID 
-    new_df = pd.DataFrame(list(product(teams, teams)), columns = ['TeamID1', 'TeamID2'])
-    new_df = new_df.loc[new_df['TeamID1'] != new_df['TeamID2'],:].sort_values(['TeamID1'], ascending = True)
-    new_df = new_df.loc[new_df['TeamID1'] < new_df['TeamID2'], :]
-    new_df.rename(columns = {'TeamID1': 'hTeamID', 'TeamID2': 'aTeamID'}, inplace=True)
-    new_df['Season'] = season
-    new_df['ID'] = new_df.apply(lambda x: '%s_%s_%s' % (str(x['Season']),str(x['hTeamID']),str(x['aTeamID'])),axis=1)
-    return new_df 
-
-
+                season= 2021,
+                with_id = True):
+    # season can be a single season or a list of seasons (backtesting grids)
+    df = read_raw_csv(raw_df_path)
+    new_df = season_matchups(df, seasons = season)
+    if with_id:
+        new_df['ID'] = matchup_ids(new_df['MatchupKey']).to_numpy()
+    return new_df
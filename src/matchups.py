@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# matchups are carried around as packed int64 keys: season/hTeamID/aTeamID -> 2022_1101_1102 -> 202211011102
+# the kaggle 'Season_h_a' string is only built when a submission is written
+TEAM_BASE = 10_000
+_triu_cache = {}
+
+
+def pack_matchup_key(season, h_team, a_team) -> np.ndarray:
+    season = np.asarray(season, dtype=np.int64)
+    return (season*TEAM_BASE + np.asarray(h_team, dtype=np.int64))*TEAM_BASE + np.asarray(a_team, dtype=np.int64)
+
+
+def unpack_matchup_key(key):
+    key = np.asarray(key, dtype=np.int64)
+    return key//(TEAM_BASE*TEAM_BASE), (key//TEAM_BASE) % TEAM_BASE, key % TEAM_BASE
+
+
+def pack_team_key(season, team) -> np.ndarray:
+    return np.asarray(season, dtype=np.int64)*TEAM_BASE + np.asarray(team, dtype=np.int64)
+
+
+def matchup_ids(keys) -> pd.Series:
+    season, h_team, a_team = unpack_matchup_key(keys)
+    return pd.Series(season).astype(str) + '_' + pd.Series(h_team).astype(str) + '_' + pd.Series(a_team).astype(str)
+
+
+def parse_matchup_ids(ids) -> np.ndarray:
+    parts = pd.Series(ids).str.split('_', expand=True).astype(np.int64)
+    return pack_matchup_key(parts[0].to_numpy(), parts[1].to_numpy(), parts[2].to_numpy())
+
+
+def _triu(n):
+    if n not in _triu_cache:
+        _triu_cache[n] = np.triu_indices(n, k=1)
+    return _triu_cache[n]
+
+
+def season_matchups(teams_df: pd.DataFrame, seasons = None) -> pd.DataFrame:
+    """Every hTeamID < aTeamID pair among the teams of each season, e.g. from MNCAATourneySeeds.
+
+    Args:
+        teams_df (pd.DataFrame): needs Season and TeamID.
+        seasons (int or list, optional): seasons to build. Defaults to every season in teams_df.
+    """
+    teams = teams_df[['Season', 'TeamID']].drop_duplicates().sort_values(['Season', 'TeamID'])
+    if seasons is not None:
+        teams = teams.loc[teams['Season'].isin(np.atleast_1d(seasons))]
+    season_arr = teams['Season'].to_numpy(dtype=np.int64)
+    team_arr = teams['TeamID'].to_numpy(dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, season_arr[1:] != season_arr[:-1]])
+    ends = np.r_[starts[1:], len(season_arr)]
+    h_idx, a_idx = [], []
+    for start, end in zip(starts, ends):
+        i, j = _triu(end - start)
+        h_idx.append(i + start)
+        a_idx.append(j + start)
+    h_idx = np.concatenate(h_idx) if h_idx else np.empty(0, dtype=np.int64)
+    a_idx = np.concatenate(a_idx) if a_idx else np.empty(0, dtype=np.int64)
+    return pd.DataFrame({'Season': season_arr[h_idx],
+                        'hTeamID': team_arr[h_idx],
+                        'aTeamID': team_arr[a_idx],
+                        'MatchupKey': pack_matchup_key(season_arr[h_idx], team_arr[h_idx], team_arr[a_idx])})
+
+
+def label_games(df: pd.DataFrame) -> pd.DataFrame:
+    """Adds hTeamID/aTeamID (lower id is home), Y (1.0 when the home team won) and MatchupKey to a W/L results table."""
+    w_team = df['WTeamID'].to_numpy(dtype=np.int64)
+    l_team = df['LTeamID'].to_numpy(dtype=np.int64)
+    df = df.copy()
+    df['WTeamID'] = w_team
+    df['LTeamID'] = l_team
+    df['hTeamID'] = np.minimum(w_team, l_team)
+    df['aTeamID'] = np.maximum(w_team, l_team)
+    df['Y'] = (w_team < l_team).astype(float)
+    df['MatchupKey'] = pack_matchup_key(df['Season'].to_numpy(), df['hTeamID'].to_numpy(), df['aTeamID'].to_numpy())
+    return df
+
+
+def submission_frame(keys, preds) -> pd.DataFrame:
+    return pd.DataFrame({'ID': matchup_ids(keys).to_numpy(), 'Pred': np.asarray(preds, dtype=float)})
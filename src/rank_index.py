@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from matchups import TEAM_BASE
+from as_of import DAY_BASE
+
+# the massey ordinals as one rank time series per (season, system, team): the rows are sorted by series then
+# RankingDayNum and stored as flat int16 arrays, with each series' start offset. every query is a
+# searchsorted over all selected series at once, so lookback windows can be varied without regrouping the table.
+
+
+class RankIndex(object):
+    def __init__(self, df: pd.DataFrame):
+        """
+        Args:
+            df (pd.DataFrame): massey ordinals (Season, RankingDayNum, SystemName, TeamID, OrdinalRank), e.g. the
+                filtered read behind RawFeatures.rankings.
+        """
+        systems = df['SystemName'].astype('category')
+        self.systems = list(systems.cat.categories)
+        code = systems.cat.codes.to_numpy(np.int64)
+        day = df['RankingDayNum'].to_numpy(np.int64)
+        key = (df['Season'].to_numpy(np.int64)*len(self.systems) + code)*TEAM_BASE + df['TeamID'].to_numpy(np.int64)
+        order = np.lexsort((day, key))
+        key = key[order]
+        day = day[order]
+        new_series = np.r_[True, key[1:] != key[:-1]] if len(key) else np.zeros(0, dtype=bool)
+        self.starts = np.flatnonzero(new_series)
+        self.lengths = np.diff(np.r_[self.starts, len(key)])
+        series = key[self.starts]
+        self.team = series % TEAM_BASE
+        self.system = (series//TEAM_BASE) % len(self.systems)
+        self.season = (series//TEAM_BASE)//len(self.systems)
+        self.days = day.astype(np.int16)
+        self.ranks = df['OrdinalRank'].to_numpy()[order].astype(np.int16)
+        # running rank sum within each series, for last-K averages
+        total = np.cumsum(self.ranks, dtype=np.int64)
+        self.rank_sums = (total - np.repeat(total[self.starts] - self.ranks[self.starts], self.lengths)).astype(np.int32)
+        # (series, day) of every snapshot, sorted
+        self._day_keys = (np.cumsum(new_series) - 1)*DAY_BASE + day
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _select(self, season = None, systems = None) -> np.ndarray:
+        mask = np.ones(len(self.starts), dtype=bool)
+        if season is not None:
+            mask &= np.isin(self.season, np.atleast_1d(season))
+        if systems is not None:
+            missing = [s for s in systems if s not in self.systems]
+            if missing:
+                raise KeyError(f"no rankings for {missing}")
+            mask &= np.isin(self.system, [self.systems.index(s) for s in systems])
+        return np.flatnonzero(mask)
+
+    def _positions(self, series: np.ndarray, day = None) -> np.ndarray:
+        """Latest snapshot of each series on or before day (the last one when day is None), -1 if none."""
+        day = DAY_BASE - 1 if day is None else day
+        pos = np.searchsorted(self._day_keys, series*DAY_BASE + day, side='right') - 1
+        return np.where(pos >= self.starts[series], pos, -1)
+
+    def _frame(self, series: np.ndarray, values: np.ndarray, wide: bool) -> pd.DataFrame:
+        keep = ~np.isnan(values)
+        long = pd.DataFrame({'Season': self.season[series[keep]],
+                            'TeamID': self.team[series[keep]],
+                            'SystemName': np.asarray(self.systems, dtype=object)[self.system[series[keep]]],
+                            'OrdinalRank': values[keep]})
+        if not wide:
+            return long
+        wide_df = long.pivot(index=['Season', 'TeamID'], columns='SystemName', values='OrdinalRank')
+        wide_df.columns.name = None
+        return wide_df.reset_index()
+
+    def rank_as_of(self, day: int = None, season = None, systems: list = None, wide: bool = True) -> pd.DataFrame:
+        """Each system's latest rank of every team on or before day.
+
+        Args:
+            day (int, optional): RankingDayNum. Defaults to the last snapshot of the season.
+            season (int or list, optional): seasons to answer for. Defaults to all.
+            systems (list, optional): SystemNames. Defaults to all.
+            wide (bool, optional): one column per system (Season, TeamID, POM, ...) or long rows.
+        """
+        series = self._select(season, systems)
+        pos = self._positions(series, day)
+        return self._frame(series, np.where(pos >= 0, self.ranks[np.maximum(pos, 0)], np.nan), wide)
+
+    def average_last(self, k: int, day: int = None, season = None, systems: list = None, wide: bool = True) -> pd.DataFrame:
+        """Average rank over each team's last k snapshots on or before day (fewer if the series is shorter)."""
+        series = self._select(season, systems)
+        pos = self._positions(series, day)
+        back = pos - k
+        has_back = back >= self.starts[series]
+        total = self.rank_sums[np.maximum(pos, 0)] - np.where(has_back, self.rank_sums[np.maximum(back, 0)], 0)
+        count = np.minimum(k, pos - self.starts[series] + 1)
+        return self._frame(series, np.where(pos >= 0, total/np.maximum(count, 1), np.nan), wide)
+
+    def trend(self, day_from: int, day_to: int = None, season = None, systems: list = None, wide: bool = True) -> pd.DataFrame:
+        """Rank change between day_from and day_to (negative is an improvement); NaN unless ranked at both."""
+        series = self._select(season, systems)
+        start = self._positions(series, day_from)
+        end = self._positions(series, day_to)
+        change = self.ranks[np.maximum(end, 0)].astype(np.float64) - self.ranks[np.maximum(start, 0)]
+        return self._frame(series, np.where((start >= 0) & (end >= 0), change, np.nan), wide)
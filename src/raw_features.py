@@ -1,11 +1,63 @@
 import pandas as pd
 import os
 from math import log 
-import numpy as np
 from datetime import datetime
+from data_cache import RawDataCache, default_cache
+from feature_dag import FeatureStage, run_stages
+from instrumentation import instrumented, fillna
+from as_of import AsOfFeatures
+from rank_index import RankIndex
+from elo import EloRatings, INITIAL_RATING
+from team_games import team_game_table, close_games, box_score_features, opponent_features, TEAM_KEYS, BOX_SCORE_TOTALS
+
+# compact schema for the massey ordinals, applied while the file is streamed in
+MASSEY_DTYPES = {'Season': 'int16', 
+                'RankingDayNum': 'int16', 
+                'SystemName': 'category', 
+                'TeamID': 'int16', 
+                'OrdinalRank': 'int16'}
+
+# raw table behind the team spine (every tournament team of a season)
+SPINE_TABLE = 'MNCAATourneyCompactResults'
+
+REG_SEASON_FEATURES = ['win_perc', 'ppg', 'fg_perc', 'fg3_perc', 
+                        'ft_perc', 'rb_pg', 'orb_pg', 'drb_pg', 'apg', 'ast_tov', 'tov_pg', 'stl_pg', 'second_chance', 
+                        'p_fgm_ast', 'blk_pg', 'blk_to_fouls', 'fouls_pg', 'tsp']
+
+# mid season snapshot of the elo stage (elo_d100): form going into day 100, before conference play is decided
+ELO_AS_OF_DAY = 100
+
+def current_rank_pivot(current_rankings: pd.DataFrame, good_rankings: list) -> pd.DataFrame:
+    # one column per system plus their average, systems missing a team take the average. a system can be
+    # missing from the seasons of a partial rebuild altogether (NET starts in 2019)
+    current_rank_piv = pd.pivot_table(current_rankings, index = ['Season', 'TeamID'], columns = ['SystemName'], values = ['OrdinalRank'])\
+                        .reset_index(col_level=1)
+    current_rank_piv.columns = current_rank_piv.columns.droplevel(0)
+    systems = sorted(set(good_rankings) | {c for c in current_rank_piv.columns if c not in ['Season', 'TeamID']})
+    current_rank_piv = current_rank_piv.reindex(columns = ['Season', 'TeamID'] + systems)
+    current_rank_piv['avg_rank_c'] = current_rank_piv[[c for c in current_rank_piv.columns if c not in ['Season', 'TeamID']]]\
+        .mean(axis=1, skipna=True)
+    
+    for c in good_rankings:
+        current_rank_piv.loc[current_rank_piv[c].isnull(), c]= current_rank_piv['avg_rank_c']
+    return current_rank_piv
+
+# coach_exp's state, by kind: the years of each school/coach pair, each coach's years and running tournament
+# record, each school's running record and last row (the next season's prev_wins)
+COACH_STATE_KEYS = {'pair': ['TeamID', 'CoachName'], 'coach': ['CoachName'], 'school': ['TeamID']}
+COACH_STATE_COLUMNS = ['Season', 'kind', 'TeamID', 'CoachName', 'years', 'cum_wins', 'cum_total', 'last_wins', 'last_total']
+
+def _carried(rows: pd.DataFrame, prior: pd.DataFrame, kind, column, default) -> pd.Series:
+    # each row's value of column from the latest prior state of its kind (default when there is none)
+    if prior is None or not len(prior):
+        return pd.Series(default, index=rows.index)
+    keys = COACH_STATE_KEYS[kind]
+    latest = prior.loc[prior['kind'] == kind].drop_duplicates(keys, keep='last')[keys + [column]]
+    values = rows[keys].merge(latest, on=keys, how='left')[column].fillna(default)
+    return pd.Series(values.to_numpy(), index=rows.index).astype(type(default))
 
 class RawFeatures(object):
-    def __init__(self, min_year: int, max_year: int, stage: int, data_dir: str):
+    def __init__(self, min_year: int, max_year: int, stage: int, data_dir: str, cache: RawDataCache = None):
         if min_year < 2003:
             min_year = 2003
         if max_year > 2022:
@@ -14,26 +66,135 @@ class RawFeatures(object):
         self.max_year = max_year
         self.data_dir = data_dir
         self.stage = stage
-    def get_raw_data(self, raw_df_name):
-        return pd.read_csv(f"{self.data_dir}/MDataFiles_Stage{self.stage}/{raw_df_name}.csv")
+        # shared across RawFeatures instances unless a cache is passed in
+        self.cache = cache or default_cache
+        # when set, stages only read these seasons (used by the feature store for incremental refreshes)
+        self.seasons = None
+        # stage state per season kept by the feature store from the last build ({stage: frame}), so on a
+        # partial rebuild cross season state (ratings, cumulative records, fill aggregates) resumes from it
+        self.prior_state = None
+        self._as_of = {}
+        self._rank_indexes = {}
+
+    def raw_data_path(self, raw_df_name):
+        return f"{self.data_dir}/MDataFiles_Stage{self.stage}/{raw_df_name}.csv"
+
+    @instrumented(detail = 'raw_df_name')
+    def get_raw_data(self, raw_df_name, full_history = False):
+        df = self.cache.read_csv(self.raw_data_path(raw_df_name))
+        if self.seasons is not None and not full_history and 'Season' in df.columns:
+            df = df.loc[df['Season'].isin(self.seasons)]
+        return df
+
+    @instrumented(detail = 'raw_df_name')
+    def get_filtered_raw_data(self, raw_df_name, isin = None, between = None, dtype = None):
+        if self.seasons is not None:
+            isin = dict(isin or {}, Season = list(self.seasons))
+        return self.cache.read_filtered_csv(self.raw_data_path(raw_df_name), isin=isin, between=between, dtype=dtype)
+
+    @instrumented(detail = 'raw_df_name')
+    def get_team_games(self, raw_df_name, full_history = False):
+        # one row per team per game (see team_games.py), reshaped once per raw file and shared by the stages
+        df = self.cache.derived(self.raw_data_path(raw_df_name), 'team_games', team_game_table)
+        if self.seasons is not None and not full_history:
+            df = df.loc[df['Season'].isin(self.seasons)]
+        return df
+
+    @instrumented(detail = 'raw_df_name')
+    def as_of_features(self, raw_df_name = 'MRegularSeasonDetailedResults', windows = (10,)) -> AsOfFeatures:
+        """Running per team totals for as of day snapshots: as_of_features().features_as_of(2021, 134)."""
+        return self._memo(self._as_of, raw_df_name, (raw_df_name, tuple(windows)), 
+                        lambda: AsOfFeatures(self.get_team_games(raw_df_name, full_history=True), windows=windows))
+
+    def _memo(self, memo: dict, raw_df_name, key, build):
+        # built once per version of the raw file (same size and mtime), like the raw frame lru
+        stat = os.stat(self.raw_data_path(raw_df_name))
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = memo.get(key)
+        if cached is None or cached[0] != signature:
+            cached = memo[key] = (signature, build())
+        return cached[1]
+
+    @instrumented(detail = 'raw_df_name')
+    def rank_index(self, raw_df_name = 'MMasseyOrdinals', systems = None) -> RankIndex:
+        """Rank time series for lookback experiments: rank_index(systems=['POM', 'SAG']).average_last(5, day=133)."""
+        key = (raw_df_name, tuple(systems) if systems else None, tuple(self.seasons) if self.seasons is not None else None)
+        def build():
+            df, _ = self.get_filtered_raw_data(raw_df_name, 
+                                                isin = {'SystemName': list(systems)} if systems else None, 
+                                                dtype = MASSEY_DTYPES)
+            return RankIndex(df)
+        return self._memo(self._rank_indexes, raw_df_name, key, build)
+
+    def _prior_state(self, stage):
+        # state to resume from on a partial rebuild, None when the stage has to go over the full history
+        if self.seasons is None or not self.prior_state:
+            return None
+        return self.prior_state.get(stage)
+
+    def _carry(self, stage, state: pd.DataFrame) -> pd.DataFrame:
+        """State of every season: the stored rows of the seasons that were not rebuilt, plus state."""
+        prior = self._prior_state(stage)
+        if prior is not None:
+            redone = set(self.seasons) | set(state['Season'].unique())
+            state = pd.concat([prior.loc[~prior['Season'].isin(redone)], state], ignore_index=True)
+        return state.sort_values('Season', kind='stable').reset_index(drop=True)
+
+    @staticmethod
+    def season_range(type = 'stats'):
+        if type == 'stats':
+            return 1985, 2022
+        return 2003, 2022
 
-    def build_feature_set(self, type = 'stats', save=True) -> pd.DataFrame: 
+    def stages(self, type = 'stats'):
+        # every stage returns (frame keyed by Season/TeamID, fill) and only shares the team spine
         if type == 'stats':
-            self.min_year = 1985
-            self.max_year = 2022
-        else:
-            self.min_year = 2003
-            self.max_year = 2022
+            return [FeatureStage('conference_champ', self.conference_champ, 
+                                inputs = ['MConferenceTourneyGames'], 
+                                columns = ['conf_champ', 'major_conf']), 
+                    FeatureStage('reg_season_stats', self.reg_season_stats, 
+                                inputs = ['MRegularSeasonDetailedResults'], 
+                                columns = REG_SEASON_FEATURES), 
+                    FeatureStage('opponent_stats', self.opponent_stats, 
+                                inputs = ['MRegularSeasonCompactResults'], 
+                                columns = ['close_win_perc', 'win_perc_l10', 'oppg', 'pythag_wins']), 
+                    FeatureStage('coach_exp', self.coach_exp, 
+                                inputs = ['MTeamCoaches', 'MNCAATourneyCompactResults'], 
+                                columns = ['n_yrs_at_school', 'coach_tot_yrs', 'prev_wins', 'coach_cum_wp', 'school_cum_wp'], 
+                                carries_forward = True), 
+                    FeatureStage('elo', self.elo, 
+                                inputs = ['MRegularSeasonCompactResults'], 
+                                columns = ['elo', 'elo_pre', f"elo_d{ELO_AS_OF_DAY}"], 
+                                carries_forward = True)]
+        return [FeatureStage('tourn_seed', self.tourn_seed, 
+                            inputs = ['MNCAATourneySeeds'], 
+                            columns = ['tourn_seed']), 
+                FeatureStage('rankings', self.rankings, 
+                            inputs = ['MMasseyOrdinals'], 
+                            columns = ['avg_rank_c', 'avg_rank_l31', 'avg_rank_l61', 'avg_rank_l91', 'avg_rank_pre', 'avg_rank_exp'])]
+
+    def input_tables(self, type = 'stats') -> dict:
+        """Raw tables behind a feature set -> whether their rows feed later seasons too (read by a stage that
+        carries forward), so a change there dirties every later season."""
+        tables = {SPINE_TABLE: False}
+        for stage in self.stages(type):
+            for table in stage.inputs:
+                tables[table] = tables.get(table, False) or stage.carries_forward
+        return tables
+
+    @instrumented(detail = 'type')
+    def build_feature_set(self, type = 'stats', save=True, max_workers = None, executor = 'thread') -> pd.DataFrame: 
+        self.min_year, self.max_year = self.season_range(type)
 
         self.team_df_build()
+        # fill value, state per season and the seasons that took the fill of every stage, recorded by the feature store
+        self.fills, self.state, self.filled = {}, {}, {}
+        self.feature_set = run_stages(self.stages(type), self.feature_set, max_workers=max_workers, executor=executor, 
+                                    fills=self.fills, state=self.state, filled=self.filled)
         if type == 'stats':
-            self.conference_champ()
-            self.reg_season_stats()
-            self.opponent_stats()
-            self.coach_exp()
-        else:
-            self.tourn_seed()
-            self.rankings()
+            # needs both reg_season_stats and opponent_stats, kept next to the opponent features
+            self.feature_set.insert(list(self.feature_set.columns).index('pythag_wins') + 1, 'ppg_oppg_ratio', 
+                                    self.feature_set['ppg']/self.feature_set['oppg'])
         
         if 'year_trend' not in self.feature_set.columns:
             self.feature_set['year_trend'] = self.feature_set['Season'].apply(lambda x: log((x+.001) - self.min_year)) 
@@ -42,7 +203,8 @@ class RawFeatures(object):
 
         return self.feature_set
     
-    def team_df_build(self, raw_df_name = 'MNCAATourneyCompactResults' ):
+    @instrumented()
+    def team_df_build(self, raw_df_name = SPINE_TABLE):
         df = self.get_raw_data(raw_df_name)
         winning_teams = df[['Season', 'WTeamID']].loc[(df['Season'] >= self.min_year) & (df['Season'] <= self.max_year)]\
                             .drop_duplicates()\
@@ -55,29 +217,39 @@ class RawFeatures(object):
 
         self.feature_set = all_teams 
     
+    @instrumented()
     def tourn_seed(self, raw_df_name = 'MNCAATourneySeeds'):
         df = df = self.get_raw_data(raw_df_name)
         df = df.loc[(df['Season'] >= self.min_year) & (df['Season'] <= self.max_year)]
-        df['tourn_seed'] = df["Seed"].apply(lambda x: int(x[1:3]))
-        self.feature_set = pd.merge(self.feature_set, df[['TeamID','Season','tourn_seed']], on = ['Season', 'TeamID'], how='left').fillna(16)
+        df['tourn_seed'] = df["Seed"].str[1:3].astype(int)
+        return df[['Season', 'TeamID', 'tourn_seed']], 16
 
     
+    @instrumented()
     def rankings(self, 
                 raw_df_name = 'MMasseyOrdinals', 
-                good_rankings = ['POM', 'RPI', 'AP', 'NET', 'KPK','MAS', 'SAG', 'USA','MOR']):
+                good_rankings = ['POM', 'RPI', 'AP', 'NET', 'KPK','MAS', 'SAG', 'USA','MOR'], 
+                report = False):
         last_day = 133
-        df = self.get_raw_data(raw_df_name)
-        df = df.loc[(df['Season'] >= self.min_year) & (df['Season'] <= self.max_year)]\
-                .loc[df['SystemName'].isin(good_rankings)]
-        current_rankings = df.loc[df['RankingDayNum'] == last_day]
-        current_rank_piv = pd.pivot_table(current_rankings, index = ['Season', 'TeamID'], columns = ['SystemName'], values = ['OrdinalRank'])\
-                            .reset_index(col_level=1)
-        current_rank_piv.columns = current_rank_piv.columns.droplevel(0)
-        current_rank_piv['avg_rank_c'] = current_rank_piv[[c for c in current_rank_piv.columns if c not in ['Season', 'TeamID']]]\
-            .mean(axis=1, skipna=True)
-        
-        for c in good_rankings:
-            current_rank_piv.loc[current_rank_piv[c].isnull(), c]= current_rank_piv['avg_rank_c']
+        # filters are pushed into the read so only the kept rows are ever held in memory
+        df, self.rankings_ingest = self.get_filtered_raw_data(raw_df_name, 
+                                                            isin = {'SystemName': good_rankings}, 
+                                                            between = {'Season': (self.min_year, self.max_year)}, 
+                                                            dtype = MASSEY_DTYPES)
+        if report:
+            print(f"{raw_df_name}: kept {self.rankings_ingest['rows_kept']:,} of {self.rankings_ingest['rows_scanned']:,} rows "
+                  f"({self.rankings_ingest['source']})")
+        current_rank_piv = current_rank_pivot(df.loc[df['RankingDayNum'] == last_day], good_rankings)
+        # the fill is the max over every season: a partial rebuild takes the other seasons' maxes from the stored state
+        state = current_rank_piv.groupby('Season').agg(max_rank = ('avg_rank_c', 'max')).reset_index()
+        if self.seasons is not None and self._prior_state('rankings') is None:
+            every_season, _ = self.cache.read_filtered_csv(self.raw_data_path(raw_df_name), 
+                                                        isin = {'SystemName': good_rankings, 'RankingDayNum': [last_day]}, 
+                                                        between = {'Season': (self.min_year, self.max_year)}, 
+                                                        dtype = MASSEY_DTYPES)
+            state = current_rank_pivot(every_season, good_rankings).groupby('Season').agg(max_rank = ('avg_rank_c', 'max')).reset_index()
+        state = self._carry('rankings', state)
+        max_fill = state['max_rank'].max()
 
         # Rank trends: Last 31 days, last 61 days, last 91 days, last 3 years 
         weekly_cuts = [4,8,12]
@@ -86,22 +258,22 @@ class RawFeatures(object):
         hist_piv = hist_long.pivot_table( index=['Season', 'TeamID'], columns = ['rownum'], values = ['OrdinalRank']).reset_index()
         hist_piv.columns = ['Season', 'TeamID', 'avg_rank_l31', 'avg_rank_l61', 'avg_rank_l91']
 
-        # fill with the max (unranked)
-        max_fill = current_rank_piv.avg_rank_c.max()
-        all_ranks = pd.merge(current_rank_piv, hist_piv, on = ['Season', 'TeamID'], how = 'left').fillna(max_fill)
-        all_ranks['rank_l31_delta'] = all_ranks['avg_rank_l31']/all_ranks['avg_rank_c']
-        all_ranks['rank_l61_delta'] = all_ranks['avg_rank_l61']/all_ranks['avg_rank_c']
-        all_ranks['rank_l91_delta'] = all_ranks['avg_rank_l61']/all_ranks['avg_rank_c']
+        # unranked teams take the max, left to the stage fill so the partitions that took it are known
+        all_ranks = pd.merge(current_rank_piv, hist_piv, on = ['Season', 'TeamID'], how = 'left')
+        all_ranks['rank_l31_delta'] = all_ranks['avg_rank_l31'].fillna(max_fill)/all_ranks['avg_rank_c']
+        all_ranks['rank_l61_delta'] = all_ranks['avg_rank_l61'].fillna(max_fill)/all_ranks['avg_rank_c']
+        all_ranks['rank_l91_delta'] = all_ranks['avg_rank_l61'].fillna(max_fill)/all_ranks['avg_rank_c']
         
         # pre season
         df['rownum'] = df.groupby(['SystemName', 'Season'])['RankingDayNum'].rank(method='dense', ascending=True)
         pre_long = df.loc[df['rownum'] == 1].groupby(['Season', "TeamID"])['OrdinalRank'].mean().reset_index()
         pre_long.columns = ['Season', 'TeamID', 'avg_rank_pre']
-        all_ranks = pd.merge(all_ranks, pre_long, on=['Season', 'TeamID'], how='left').fillna(max_fill)
-        all_ranks['avg_rank_exp'] = all_ranks['avg_rank_pre']/all_ranks['avg_rank_c']
+        all_ranks = pd.merge(all_ranks, pre_long, on=['Season', 'TeamID'], how='left')
+        all_ranks['avg_rank_exp'] = all_ranks['avg_rank_pre'].fillna(max_fill)/all_ranks['avg_rank_c']
 
-        self.feature_set = pd.merge(self.feature_set, all_ranks, on = ['Season', 'TeamID'], how='left').fillna(max_fill)
+        return all_ranks, max_fill, state
     
+    @instrumented()
     def conference_champ(self, 
                         raw_df_name = 'MConferenceTourneyGames',
                         major_conf = ['big_twelve', 'pac_ten','big_ten', 'pac_twelve', 'big_east', 'acc', 'sec']):
@@ -110,100 +282,32 @@ class RawFeatures(object):
         conference_champs = df.loc[df['champ_game'] == 1][['Season', 'WTeamID']]
         conference_champs.rename(columns = {'WTeamID': 'TeamID'}, inplace=True)
         conference_champs['conf_champ'] = 1 
-        self.feature_set = pd.merge(self.feature_set, conference_champs, on = ['Season', 'TeamID'], how='left').fillna(0)
 
         winning_teams = df[['Season', 'ConfAbbrev', 'WTeamID']].rename(columns = {'WTeamID': 'TeamID'})
         losing_teams = df[['Season', 'ConfAbbrev', 'LTeamID']].rename(columns = {'LTeamID': 'TeamID'})  
         all_teams = pd.concat([winning_teams, losing_teams]).drop_duplicates()
         all_teams.loc[all_teams['ConfAbbrev'].isin(major_conf), 'major_conf'] = 1 
-        all_teams.fillna(0, inplace=True)
+        all_teams = fillna(all_teams, 0)
         all_teams = all_teams[['Season', 'TeamID', 'major_conf']]
-        self.feature_set = pd.merge(self.feature_set, all_teams, on = ['Season', 'TeamID'], how='left').fillna(0)
+        conf_feats = pd.merge(all_teams, conference_champs, on = ['Season', 'TeamID'], how='outer')
+        # a team can show up more than once in a season's conference games
+        conf_feats = conf_feats.groupby(['Season', 'TeamID']).max().reset_index()
+        return conf_feats[['Season', 'TeamID', 'conf_champ', 'major_conf']], 0
 
+    @instrumented()
     def reg_season_stats(self, raw_df_name = 'MRegularSeasonDetailedResults'):
-        df = self.get_raw_data(raw_df_name)
-        # team, season, total games 
-        # total stats 
-        # WFGM3,WFGA3,WFTM,WFTA,WOR,WDR,WAst,WTO,WStl,WBlk
-        winning_teams_all = df.groupby(['Season', 'WTeamID'])\
-                            .agg({'DayNum': ['nunique'], 
-                                'WScore': ['sum'], 
-                                'WFGM': ['sum'], 
-                                'WFGA': ['sum'], 
-                                'WFGM3': ['sum'], 
-                                'WFGA3': ['sum'], 
-                                'WFTM': ['sum'], 
-                                'WFTA': ['sum'], 
-                                'WOR': ['sum'], 
-                                'WDR': ['sum'], 
-                                'WAst': ['sum'], 
-                                'WTO': ['sum'], 
-                                'WStl': ['sum'], 
-                                'WBlk': ['sum'], 
-                                'WPF': ['sum']}).reset_index()
-        losing_teams_all = df.groupby(['Season', 'LTeamID'])\
-                            .agg({'DayNum': ['nunique'], 
-                                'LScore': ['sum'], 
-                                'LFGM': ['sum'], 
-                                'LFGA': ['sum'], 
-                                'LFGM3': ['sum'], 
-                                'LFGA3': ['sum'], 
-                                'LFTM': ['sum'], 
-                                'LFTA': ['sum'], 
-                                'LOR': ['sum'], 
-                                'LDR': ['sum'], 
-                                'LAst': ['sum'], 
-                                'LTO': ['sum'], 
-                                'LStl': ['sum'], 
-                                'LBlk': ['sum'], 
-                                'LPF': ['sum']}).reset_index()
-        losing_teams_all.columns = ['Season', 'TeamID', 'games', 'total_score', 'fgm', 'fga', 
-                                    'fgm3', 'fga3', 'ftm', 'fta', 'orb', 'drb', 'ast', 'to', 'stl', 'blk', 'fouls']
-        winning_teams_all.columns = ['Season', 'TeamID', 'games', 'total_score', 'fgm', 'fga', 
-                                    'fgm3', 'fga3', 'ftm', 'fta', 'orb', 'drb', 'ast', 'to', 'stl', 'blk', 'fouls']
-        losing_teams_all['wins'] = 0
-        winning_teams_all['wins'] = winning_teams_all['games']
-
-        reg_stats = pd.concat([losing_teams_all, winning_teams_all])
-        agg_dict = {}
-        for c in reg_stats.columns:
-            if c in ['TeamID', 'Season']:
-                continue
-            else:
-                agg_dict[c] = ['sum']
-        total_reg_stats = reg_stats.groupby(['Season', 'TeamID'])\
-                        .agg(agg_dict).reset_index()
-        total_reg_stats.columns = ['Season', 'TeamID', 'games', 'total_score', 'fgm', 'fga', 
-                                    'fgm3', 'fga3', 'ftm', 'fta', 'orb', 'drb', 'ast', 'to', 'stl', 'blk','fouls', 'wins'] 
-
+        df = self.get_team_games(raw_df_name)
+        # team, season, total games, wins and total box score stats in one pass
+        total_reg_stats = df.groupby(TEAM_KEYS, sort=False)\
+                            .agg(games = ('game_id', 'size'), 
+                                wins = ('win', 'sum'), 
+                                **{name: (c, 'sum') for name, c in BOX_SCORE_TOTALS.items()}).reset_index()
         # per game and season stats 
-        total_reg_stats['win_perc'] = total_reg_stats['wins']/total_reg_stats['games']
-        total_reg_stats['ppg'] = total_reg_stats['total_score']/total_reg_stats['games']
-        total_reg_stats['fg_perc'] = total_reg_stats['fgm']/total_reg_stats['fga']
-        total_reg_stats['fg3_perc'] = total_reg_stats['fgm3']/total_reg_stats['fga3']
-        total_reg_stats['ft_perc'] = total_reg_stats['ftm']/total_reg_stats['fta']
-        total_reg_stats['rb_pg'] = (total_reg_stats['orb'] + total_reg_stats['drb'])/total_reg_stats['games']
-        total_reg_stats['orb_pg'] = total_reg_stats['orb']/total_reg_stats['games']
-        total_reg_stats['drb_pg'] = total_reg_stats['drb']/total_reg_stats['games']
-        total_reg_stats['apg'] = total_reg_stats['ast']/total_reg_stats['games']
-        total_reg_stats['ast_tov'] = total_reg_stats['ast']/total_reg_stats['to']
-        total_reg_stats['tov_pg'] =total_reg_stats['to']/total_reg_stats['games']
-        total_reg_stats['stl_pg'] = total_reg_stats['stl']/total_reg_stats['games']
-        total_reg_stats['second_chance'] = (total_reg_stats['stl'] + total_reg_stats['orb'])/total_reg_stats['to']
-        total_reg_stats['p_fgm_ast'] = total_reg_stats['ast']/total_reg_stats['fgm']
-        total_reg_stats['blk_pg'] = total_reg_stats['blk']/total_reg_stats['games']
-        total_reg_stats['blk_to_fouls'] = total_reg_stats['blk']/total_reg_stats['fouls']
-        total_reg_stats['fouls_pg'] = total_reg_stats['fouls']/total_reg_stats['games']
-        total_reg_stats['tsp'] = total_reg_stats['total_score']/(2*(total_reg_stats['fga'] + .44*total_reg_stats['fta']))
-        
-
-        features_to_keep = ['Season','TeamID', 'win_perc', 'ppg', 'fg_perc', 'fg3_perc', 
-                            'ft_perc', 'rb_pg', 'orb_pg', 'drb_pg', 'apg', 'ast_tov', 'tov_pg', 'stl_pg', 'second_chance', 
-                            'p_fgm_ast', 'blk_pg', 'blk_to_fouls', 'fouls_pg', 'tsp']   
-        reg_stats_feature_set = total_reg_stats[features_to_keep]  
-        self.feature_set = pd.merge(self.feature_set, reg_stats_feature_set, on = ['Season', 'TeamID'], how='left').fillna(0)
+        total_reg_stats = box_score_features(total_reg_stats)
+        return total_reg_stats[['Season', 'TeamID'] + REG_SEASON_FEATURES], 0
 
     
+    @instrumented()
     def opponent_stats(self, raw_df_name = 'MRegularSeasonCompactResults'):
         """_summary_
         oppg: opponents points per game 
@@ -214,78 +318,113 @@ class RawFeatures(object):
         Args:
             raw_df_name (str, optional): _description_. Defaults to 'MRegularSeasonDetailedResults'.
         """
-        df = df = self.get_raw_data(raw_df_name)
-        conf_df = self.get_raw_data(raw_df_name= 'MConferenceTourneyGames')
-        df['score_diff'] = df['WScore'] - df['LScore']
-        close_games = df.loc[(df['score_diff'] <= 10) | (df['NumOT'] > 0)]
-        close_wins = close_games.groupby(['Season', 'WTeamID'])['DayNum'].count().reset_index()
-        close_wins.columns = ['Season', 'TeamID', 'close_wins']
-        close_losses = close_games.groupby(['Season', 'LTeamID'])['DayNum'].count().reset_index() 
-        close_losses.columns = ['Season', 'TeamID', 'close_losses']
-        all = pd.concat([close_losses[['Season', 'TeamID']], close_wins[['Season', 'TeamID']]]).drop_duplicates()
-        all = pd.merge(all, close_wins, on = ['Season', 'TeamID'], how='left').fillna(0)
-        all = pd.merge(all, close_losses, on= ['Season', 'TeamID'], how='left').fillna(0)
-        all['close_win_perc'] = all['close_wins']/(all['close_wins'] + all['close_losses'])
-        self.feature_set = pd.merge(self.feature_set, all[['Season', 'TeamID', 'close_win_perc']], 
-                                        on = ['Season', 'TeamID'], how='left').fillna(0)
-        # last ten win percentage 
-        cols = ['Season', 'DayNum', 'WTeamID', 'LTeamID']
-        all_games = df.sort_values(['Season', 'DayNum'], ascending = True)
-        all_games['game_id'] = np.arange(len(all_games))
-        # Season, TeamID, game_id, win (1/0)
-        last_10_w = all_games[['Season', 'DayNum', 'game_id', 'WTeamID', 'WScore']]
-        last_10_w['win'] = 1 
-        last_10_w.columns = ['Season', 'DayNum', 'game_id', 'TeamID', 'points','win']
-        last_10_l = all_games[['Season', 'DayNum', 'game_id', 'LTeamID', 'LScore']]
-        last_10_l['win'] = 0
-        last_10_l.columns = ['Season', 'DayNum', 'game_id', 'TeamID', 'points','win']
-        last_10 = pd.concat([last_10_l, last_10_w])
-        last_10['cut'] = last_10.groupby(['Season', 'TeamID'])['game_id'].rank(method='dense', ascending = False)
-        last_10_wins = last_10.loc[last_10['cut'] <= 10].groupby(['Season', 'TeamID'])['win'].sum().reset_index()
-        last_10_wins.columns = ['Season', 'TeamID', 'wins']
-        last_10_wins['win_perc_l10'] = last_10_wins['wins']/10
-        # merge
-        self.feature_set = pd.merge(self.feature_set, last_10_wins[['Season', 'TeamID', 'win_perc_l10']], 
-                                    on = ['Season', 'TeamID'], how = 'left')
-        # oppg 
-        total_points = last_10.groupby(['game_id'])['points'].sum().reset_index()
-        total_points.columns = ['game_id', 'total_points']
-        all_games_points = last_10.merge(total_points, on ='game_id', how='left').fillna(0)
-        all_games_points['opp_score'] = all_games_points['total_points'] - all_games_points['points']
-        op_pg = all_games_points.groupby(['Season', 'TeamID']).agg({'opp_score': ['sum'], 
-                                                                    'game_id': ['nunique'], 
-                                                                    'points': ['sum']}).reset_index()
-        # NEED TO FIX THE COLUMN INDEXES 
-        op_pg.columns = ['Season', 'TeamID', 'opp_score', 'games', 'total_points']
-        op_pg['oppg'] = op_pg['opp_score']/op_pg['games']
-        op_pg['pythag_wins'] = op_pg['total_points']**(11.5)/(op_pg['total_points']**(11.5) + op_pg['opp_score']**(11.5))
-        fillavg = op_pg['oppg'].mean()
-        fillavg_p = op_pg['pythag_wins'].mean()
-        self.feature_set = pd.merge(self.feature_set, 
-                                    op_pg[['Season', 'TeamID', 'oppg']], on = ['Season', 'TeamID'], how ='left').fillna(fillavg)
-        self.feature_set = pd.merge(self.feature_set, 
-                                    op_pg[['Season', 'TeamID', 'pythag_wins']], on = ['Season', 'TeamID'], how ='left').fillna(fillavg_p)
-        self.feature_set['ppg_oppg_ratio'] = self.feature_set['ppg']/self.feature_set['oppg']
+        # the mean fills cover every season: a partial rebuild adds the stored per season sums of the others
+        df = self.get_team_games(raw_df_name, full_history = self._prior_state('opponent_stats') is None)
+        close = close_games(df)
+        # last ten win percentage: games are numbered in (Season, DayNum) order, so count back from the end
+        last_10 = df.groupby(TEAM_KEYS, sort=False).cumcount(ascending=False) < 10
+        df = df.assign(close_games = close, 
+                        close_wins = close & (df['win'] == 1), 
+                        l10_wins = last_10 & (df['win'] == 1))
+        op_pg = df.groupby(TEAM_KEYS, sort=False)\
+                    .agg(games = ('game_id', 'size'), 
+                        total_score = ('Score', 'sum'), 
+                        opp_score = ('OppScore', 'sum'), 
+                        close_games = ('close_games', 'sum'), 
+                        close_wins = ('close_wins', 'sum'), 
+                        l10_wins = ('l10_wins', 'sum')).reset_index()
+        op_pg = opponent_features(op_pg)
+        state = op_pg.groupby('Season')\
+                    .agg(oppg_sum = ('oppg', 'sum'), 
+                        oppg_n = ('oppg', 'count'), 
+                        pythag_wins_sum = ('pythag_wins', 'sum'), 
+                        pythag_wins_n = ('pythag_wins', 'count')).reset_index()
+        state = self._carry('opponent_stats', state)
+        fill = {'close_win_perc': 0, 
+                'win_perc_l10': 0, 
+                'oppg': state['oppg_sum'].sum()/state['oppg_n'].sum(), 
+                'pythag_wins': state['pythag_wins_sum'].sum()/state['pythag_wins_n'].sum()}
+        if self.seasons is not None:
+            op_pg = op_pg.loc[op_pg['Season'].isin(self.seasons)]
+        return op_pg[['Season', 'TeamID', 'close_win_perc', 'win_perc_l10', 'oppg', 'pythag_wins']], fill, state
 
+    @instrumented()
     def coach_exp(self, raw_df_name = "MTeamCoaches"):
-        df = self.get_raw_data(raw_df_name=raw_df_name)
-        tourney_results = self.get_raw_data(raw_df_name = "MNCAATourneyCompactResults")
+        # cumulative records need every earlier season: a partial rebuild resumes from the stored records at the
+        # end of the season before the first rebuilt one, a full build starts from nothing
+        df = self.get_raw_data(raw_df_name=raw_df_name, full_history=True)
+        tourney_results = self.get_team_games(raw_df_name = "MNCAATourneyCompactResults", full_history=True)
+        prior = self._prior_state('coach_exp')
+        if prior is not None:
+            start = min(self.seasons)
+            df = df.loc[df['Season'] >= start]
+            tourney_results = tourney_results.loc[tourney_results['Season'] >= start]
+            prior = prior.loc[prior['Season'] < start]
         # season, teamid, n_years_at_school, n_years_coaching, coach_tourn_wp
+        all_tourney = tourney_results.groupby(TEAM_KEYS, sort=False)\
+                        .agg(wins = ('win', 'sum'), total_games = ('game_id', 'size')).reset_index()
+        school_games = fillna(df.merge(all_tourney, on= ['Season', 'TeamID'], how='left'), 0)\
+                        .sort_values(['Season'], kind='stable').reset_index(drop=True)
+        carried = lambda kind, column, default: _carried(school_games, prior, kind, column, default)
+
+        school_games['n_yrs_at_school'] = carried('pair', 'years', 0) + school_games.groupby(['TeamID', 'CoachName']).cumcount() + 1 
+        school_games['coach_tot_yrs'] = carried('coach', 'years', 0) + school_games.groupby(['CoachName']).cumcount() + 1  
+        # the school's previous row: last season, or an earlier coach of the same season
+        prev = school_games.groupby(['TeamID'])[['wins', 'total_games']].shift(1)
+        school_games['prev_wins'] = prev['wins'].fillna(carried('school', 'last_wins', float('nan')))
+        school_games['prev_total'] = prev['total_games'].fillna(carried('school', 'last_total', float('nan')))
+        # coach cum win percentage, school cum wp, last year wins (running totals skip the rows without a previous one)
+        for kind, keys in COACH_STATE_KEYS.items():
+            if kind == 'pair':
+                continue
+            for c in ['wins', 'total']:
+                school_games[f"{kind}_cum_{c}"] = carried(kind, f"cum_{c}", 0) + \
+                    school_games[f"prev_{c}"].fillna(0).groupby([school_games[k] for k in keys]).cumsum()
+            school_games[f"{kind}_cum_wp"] = (school_games[f"{kind}_cum_wins"]/school_games[f"{kind}_cum_total"])\
+                                                .where(school_games['prev_wins'].notna())
+
+        # records at the end of each season, for the next partial rebuild
+        state = pd.concat([school_games.drop_duplicates(['Season', 'TeamID', 'CoachName'], keep='last')\
+                                .rename(columns = {'n_yrs_at_school': 'years'}).assign(kind = 'pair'), 
+                            school_games.drop_duplicates(['Season', 'CoachName'], keep='last')\
+                                .rename(columns = {'coach_tot_yrs': 'years', 'coach_cum_wins': 'cum_wins', 'coach_cum_total': 'cum_total'})\
+                                .assign(kind = 'coach', TeamID = -1), 
+                            school_games.drop_duplicates(['Season', 'TeamID'], keep='last')\
+                                .rename(columns = {'school_cum_wins': 'cum_wins', 'school_cum_total': 'cum_total', 
+                                                    'wins': 'last_wins', 'total_games': 'last_total'})\
+                                .assign(kind = 'school', CoachName = '')], ignore_index=True)
+        state = self._carry('coach_exp', state[COACH_STATE_COLUMNS])
 
-        df['n_yrs_at_school'] = df.sort_values(['Season'], ascending=True).groupby(['TeamID', 'CoachName'])['Season'].cumcount() + 1 
-        df['coach_tot_yrs'] = df.sort_values(['Season'], ascending=True).groupby(['CoachName'])['Season'].cumcount() + 1  
-        tourney_wins = tourney_results.groupby(['Season', 'WTeamID'])['DayNum'].nunique().reset_index()
-        tourney_losses = tourney_results.groupby(['Season', 'LTeamID'])['DayNum'].nunique().reset_index() 
-        tourney_wins.rename(columns = {'WTeamID': 'TeamID', 'DayNum': 'wins'}, inplace=True)
-        tourney_losses.rename(columns = {'LTeamID':'TeamID', 'DayNum': 'losses'}, inplace=True)
-        all_tourney = tourney_wins.merge(tourney_losses, on = ['Season', 'TeamID'], how ='outer').fillna(0)
-        all_tourney['total_games'] = all_tourney['wins'] + all_tourney['losses']
-        school_games = df.merge(all_tourney, on= ['Season', 'TeamID'], how='left').fillna(0)
-        school_games['prev_wins'] = school_games.sort_values(['Season', 'TeamID'], ascending=True).groupby(['TeamID']).wins.shift(1)
-        school_games['prev_losses'] = school_games.sort_values(['Season', 'TeamID'], ascending=True).groupby(['TeamID']).losses.shift(1)
-        school_games['prev_total'] = school_games.sort_values(['Season', 'TeamID'], ascending=True).groupby(['TeamID']).total_games.shift(1)
-        # coach cum win percentage, school cum wp, last year wins 
-        school_games['coach_cum_wp'] = school_games.sort_values(['Season'], ascending=True).groupby(['CoachName'])['prev_wins'].cumsum()/school_games.sort_values(['Season'], ascending=True).groupby(['CoachName'])['prev_total'].cumsum()
-        school_games['school_cum_wp'] = school_games.sort_values(['Season'], ascending=True).groupby(['TeamID'])['prev_wins'].cumsum()/school_games.sort_values(['Season'], ascending=True).groupby(['TeamID'])['prev_total'].cumsum()
         features = ['Season','TeamID', 'n_yrs_at_school', 'coach_tot_yrs', 'prev_wins', 'coach_cum_wp', 'school_cum_wp']
-        self.feature_set = self.feature_set.merge(school_games[features], on = ['Season', 'TeamID'], how = 'left').fillna(0)
+        # mid season coaching changes: keep the coach in charge at the end of the season
+        school_games = school_games.sort_values(['Season', 'TeamID', 'LastDayNum'])
+        return school_games[features], 0, state
+
+    @instrumented()
+    def elo(self, raw_df_name = 'MRegularSeasonCompactResults', setting = None, day_num = ELO_AS_OF_DAY):
+        """
+        elo: rating at the end of the regular season (conference tournaments included)
+        elo_pre: rating going into the season, after regression to the mean
+        elo_d{day_num}: rating going into day_num
+        Args:
+            setting (dict, optional): overrides elo.DEFAULT_SETTING (k, home, regress, mov).
+            day_num (int, optional): DayNum of the as of day column, None leaves it out.
+        """
+        # ratings carry across seasons: a partial rebuild replays from the stored ratings at the end of the season
+        # before the first rebuilt one, a full build replays the whole history
+        games = self.get_raw_data(raw_df_name, full_history=True)
+        prior = self._prior_state('elo')
+        initial = None
+        if prior is not None:
+            games = games.loc[games['Season'] >= min(self.seasons)]
+            prior = prior.loc[prior['Season'] < min(self.seasons)]
+            if len(prior):
+                initial = prior.loc[prior['Season'] == prior['Season'].max()]
+        ratings = EloRatings(games, settings = [setting or {}], initial = initial)
+        end = ratings.ratings_as_of()
+        pre = ratings.ratings_as_of(day_num = 0).rename(columns = {'elo': 'elo_pre'})
+        features = end.merge(pre, on = ['Season', 'TeamID'])
+        if day_num is not None:
+            as_of = ratings.ratings_as_of(day_num = day_num).rename(columns = {'elo': f"elo_d{day_num}"})
+            features = features.merge(as_of, on = ['Season', 'TeamID'])
+        return features, INITIAL_RATING, self._carry('elo', ratings.season_end_ratings())
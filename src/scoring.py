@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from functools import reduce
+from data_cache import LRUCache
+from head_to_head import TeamSeasonIndex, safe_ratio
+
+# interactive scoring: the raw feature sets are indexed once by (Season, TeamID) and each request only
+# gathers two rows per game, builds the model's columns with array ops and calls the booster directly.
+# expected score features built in main.py / the feature selection notebook
+EXTRA_FEATURES = {'exp_score': (.35, .65),
+                  'exp_points': (.4, .6)}
+
+
+def load_model(model):
+    """Saved xgboost model path (e.g. top_feat_model.json), a Booster or an XGBClassifier."""
+    if isinstance(model, str):
+        import xgboost as xgb
+        booster = xgb.Booster()
+        booster.load_model(model)
+        return booster
+    if hasattr(model, 'get_booster'):
+        return model.get_booster()
+    return model
+
+
+def merge_feature_sets(feature_sets: list) -> pd.DataFrame:
+    frames = [pd.read_csv(f) if isinstance(f, str) else f for f in feature_sets]
+    def merge(left, right):
+        right = right[['Season', 'TeamID'] + [c for c in right.columns if c not in left.columns]]
+        return left.merge(right, on = ['Season', 'TeamID'], how = 'outer')
+    return reduce(merge, frames)
+
+
+class MatchupScorer(object):
+    def __init__(self, feature_sets: list, model, feature_names: list = None, cache_size: int = 100_000):
+        """
+        Args:
+            feature_sets (list): raw feature sets (stats, rank) as DataFrames or csv paths.
+            model: saved xgboost model path, Booster or XGBClassifier.
+            feature_names (list, optional): model input columns. Defaults to the names saved with the model.
+            cache_size (int, optional): number of pair probabilities kept in the lru.
+        """
+        self.model = load_model(model)
+        self.feature_names = list(feature_names or self.model.feature_names)
+        self.index = TeamSeasonIndex(merge_feature_sets(feature_sets), dtype=np.float32)
+        self.cache = LRUCache(cache_size)
+        self._plan()
+
+    def _plan(self):
+        # model column -> (kind, team feature position), grouped by kind so a batch is a few fancy index ops
+        lookup = {f: i for i, f in enumerate(self.index.feature_names)}
+        plan = {'h': ([], []), 'a': ([], []), 'diff': ([], []), 'ratio': ([], [])}
+        self.extras = []
+        for j, name in enumerate(self.feature_names):
+            if name in EXTRA_FEATURES:
+                self.extras.append((j, EXTRA_FEATURES[name]))
+            elif name == 'year_trend':
+                self.extras.append((j, None))
+            elif name.endswith('_diff') and name[:-5] in lookup:
+                plan['diff'][0].append(j)
+                plan['diff'][1].append(lookup[name[:-5]])
+            elif name.endswith('_ratio') and name[:-6] in lookup:
+                plan['ratio'][0].append(j)
+                plan['ratio'][1].append(lookup[name[:-6]])
+            elif name[0] in ('h', 'a') and name[1:] in lookup:
+                plan[name[0]][0].append(j)
+                plan[name[0]][1].append(lookup[name[1:]])
+            else:
+                raise ValueError(f"can't build model feature {name} from the feature sets")
+        self.plan = {k: (np.array(out, dtype=np.int64), np.array(feat, dtype=np.int64)) for k, (out, feat) in plan.items()}
+        self.ppg = lookup.get('ppg')
+        self.oppg = lookup.get('oppg')
+
+    def features(self, season, h_team, a_team) -> np.ndarray:
+        """Model input matrix for games between h_team (lower id) and a_team."""
+        season = np.atleast_1d(season)
+        h_rows = self.index.positions(season, np.atleast_1d(h_team))
+        a_rows = self.index.positions(season, np.atleast_1d(a_team))
+        H = self.index.values[h_rows]
+        A = self.index.values[a_rows]
+        X = np.empty((len(h_rows), len(self.feature_names)), dtype=np.float32)
+        out, feat = self.plan['h']
+        X[:, out] = H[:, feat]
+        out, feat = self.plan['a']
+        X[:, out] = A[:, feat]
+        out, feat = self.plan['diff']
+        X[:, out] = H[:, feat] - A[:, feat]
+        out, feat = self.plan['ratio']
+        X[:, out] = safe_ratio(H[:, feat], A[:, feat])
+        for j, weights in self.extras:
+            if weights is None:
+                X[:, j] = self.index.year_trend[h_rows]
+            else:
+                own, opp = weights
+                X[:, j] = (own*H[:, self.ppg] + opp*A[:, self.oppg]) - (own*A[:, self.ppg] + opp*H[:, self.oppg])
+        return X
+
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        if hasattr(self.model, 'inplace_predict'):
+            return np.asarray(self.model.inplace_predict(X), dtype=np.float64)
+        return np.asarray(self.model.predict_proba(X), dtype=np.float64)[:, 1]
+
+    def score(self, season: int, team_a: int, team_b: int) -> float:
+        """Probability that team_a beats team_b."""
+        return float(self.score_many([(season, team_a, team_b)])[0])
+
+    def score_many(self, pairs) -> np.ndarray:
+        """Probabilities that team_a beats team_b for (season, team_a, team_b) rows."""
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 3)
+        season, team_a, team_b = pairs[:, 0], pairs[:, 1], pairs[:, 2]
+        # the model is trained on lower id = home team, Y = 1 when home wins
+        h_team = np.minimum(team_a, team_b)
+        a_team = np.maximum(team_a, team_b)
+        p_home = np.empty(len(pairs), dtype=np.float64)
+        missing = []
+        for i, key in enumerate(zip(season.tolist(), h_team.tolist(), a_team.tolist())):
+            p = self.cache.get(key)
+            if p is None:
+                missing.append(i)
+            else:
+                p_home[i] = p
+        if missing:
+            missing = np.array(missing)
+            p_home[missing] = self._predict(self.features(season[missing], h_team[missing], a_team[missing]))
+            for i in missing.tolist():
+                self.cache.put((int(season[i]), int(h_team[i]), int(a_team[i])), p_home[i])
+        return np.where(team_a == h_team, p_home, 1 - p_home)
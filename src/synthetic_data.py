@@ -0,0 +1,198 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from bracket import bracket_slots
+
+# kaggle shaped synthetic data for benchmarks and offline runs. teams get a latent strength that drifts
+# between seasons; scores, tournament results and rankings are all drawn from it, so features and labels
+# keep a realistic relationship without any real data.
+GOOD_RANKINGS = ['POM', 'RPI', 'AP', 'NET', 'KPK', 'MAS', 'SAG', 'USA', 'MOR']
+MAJOR_CONF = ['big_twelve', 'pac_twelve', 'big_ten', 'big_east', 'acc', 'sec']
+BOX_SCORE = {'FGM': 24, 'FGA': 56, 'FGM3': 7, 'FGA3': 20, 'FTM': 13, 'FTA': 19,
+            'OR': 10, 'DR': 24, 'Ast': 13, 'TO': 13, 'Stl': 7, 'Blk': 3, 'PF': 18}
+COMPACT_COLUMNS = ['Season', 'DayNum', 'WTeamID', 'WScore', 'LTeamID', 'LScore', 'WLoc', 'NumOT']
+# tournament days by round, play-ins first
+TOURNEY_DAYS = [134, 136, 138, 143, 145, 152, 154]
+
+SCALES = {'tiny': {'min_season': 2010, 'max_season': 2022, 'n_teams': 100, 'games_per_season': 1000,
+                    'n_systems': 12, 'ranking_days': 12},
+        'small': {'min_season': 1985, 'max_season': 2022, 'n_teams': 200, 'games_per_season': 2500,
+                    'n_systems': 30, 'ranking_days': 14},
+        'full': {'min_season': 1985, 'max_season': 2022, 'n_teams': 360, 'games_per_season': 5400,
+                    'n_systems': 180, 'ranking_days': 20}}
+
+
+def _seed_labels(season: int):
+    # 4 play-in games since 2011, 1 from 2001, none before
+    play_in = ['W16', 'X16', 'Y11', 'Z11'] if season >= 2011 else (['W16'] if season >= 2001 else [])
+    labels = []
+    for line in range(1, 17):
+        for region in 'WXYZ':
+            seed = f"{region}{line:02d}"
+            labels += [seed + 'a', seed + 'b'] if seed in play_in else [seed]
+    return labels
+
+
+def _regular_season(rng, season, team_ids, strength, n_games):
+    n_teams = len(team_ids)
+    n_days = 133
+    # every day pairs off distinct teams, so (as in the real data) nobody plays twice on a day
+    per_day = np.minimum(np.bincount(rng.integers(0, n_days, n_games), minlength=n_days), n_teams//2)
+    order = rng.permuted(np.tile(np.arange(n_teams), (n_days, 1)), axis=1)[:, :2*(n_teams//2)]
+    take = np.arange(n_teams//2)[None, :] < per_day[:, None]
+    h = order[:, 0::2][take]
+    a = order[:, 1::2][take]
+    day = np.repeat(np.arange(n_days), per_day)
+    n_games = len(h)
+    loc = rng.choice(np.array(['H', 'A', 'N']), n_games, p=[.45, .45, .1])
+    home_edge = np.select([loc == 'H', loc == 'A'], [3.5, -3.5], 0)
+    h_score = np.round(68 + strength[h] + home_edge + rng.normal(0, 10, n_games)).astype(int)
+    a_score = np.round(68 + strength[a] + rng.normal(0, 10, n_games)).astype(int)
+    a_score[a_score == h_score] -= rng.integers(1, 6, (a_score == h_score).sum())
+    h_won = h_score > a_score
+    games = pd.DataFrame({'Season': season,
+                        'DayNum': day,
+                        'WTeamID': team_ids[np.where(h_won, h, a)],
+                        'WScore': np.maximum(h_score, a_score),
+                        'LTeamID': team_ids[np.where(h_won, a, h)],
+                        'LScore': np.minimum(h_score, a_score),
+                        'WLoc': np.where(h_won, loc, np.select([loc == 'H', loc == 'A'], ['A', 'H'], 'N')),
+                        'NumOT': rng.choice([0, 0, 0, 0, 0, 0, 0, 0, 1, 2], n_games)})
+    for prefix in 'WL':
+        for col, avg in BOX_SCORE.items():
+            games[prefix + col] = rng.poisson(avg, n_games)
+    return games.sort_values('DayNum', kind='stable')
+
+
+def _tournament(rng, season, team_ids, strength):
+    labels = _seed_labels(season)
+    order = np.argsort(-(strength + rng.normal(0, 2, len(strength))))[:len(labels)]
+    seeds = pd.DataFrame({'Season': season, 'Seed': labels, 'TeamID': team_ids[order]})
+    slots, _ = bracket_slots(seeds)
+    team_strength = dict(zip(team_ids, strength))
+    games = []
+
+    def play(x, y, day):
+        margin = team_strength[x] - team_strength[y] + rng.normal(0, 10)
+        w, l = (x, y) if margin > 0 else (y, x)
+        w_score = int(70 + rng.integers(0, 20))
+        games.append((season, day, w, w_score, l, w_score - max(1, int(abs(margin))), 'N', 0))
+        return w
+
+    alive = [play(s[0], s[1], TOURNEY_DAYS[0]) if len(s) == 2 else s[0] for s in slots]
+    for day in TOURNEY_DAYS[1:]:
+        alive = [play(alive[i], alive[i + 1], day + (i % 4 >= 2)) for i in range(0, len(alive), 2)]
+    return seeds, pd.DataFrame(games, columns=COMPACT_COLUMNS)
+
+
+def _conference_tourneys(rng, season, team_ids, strength, conference):
+    games = []
+    for conf in np.unique(conference):
+        alive = list(rng.permutation(team_ids[conference == conf]))
+        day = 132 - int(np.ceil(np.log2(max(len(alive), 2))))
+        while len(alive) > 1:
+            # odd team out gets a bye
+            nxt = alive[-1:] if len(alive) % 2 else []
+            for x, y in zip(alive[0::2], alive[1::2]):
+                w, l = (x, y) if strength[x - team_ids[0]] + rng.normal(0, 8) > strength[y - team_ids[0]] else (y, x)
+                games.append((season, conf, day, w, l))
+                nxt.append(w)
+            alive = nxt
+            day += 1
+    return pd.DataFrame(games, columns=['Season', 'ConfAbbrev', 'DayNum', 'WTeamID', 'LTeamID'])
+
+
+def _coaches(rng, season, team_ids, coach_ids):
+    # 10% of teams hire a new coach each season, 3% of changes happen mid season
+    changed = rng.random(len(team_ids)) < .1
+    mid_season = changed & (rng.random(len(team_ids)) < .3)
+    old = coach_ids.copy()
+    coach_ids[changed] = coach_ids.max() + 1 + np.arange(changed.sum())
+    first = pd.DataFrame({'Season': season, 'TeamID': team_ids, 'FirstDayNum': 0, 'LastDayNum': 154,
+                        'CoachName': [f"coach_{c}" for c in coach_ids]})
+    first.loc[mid_season, 'FirstDayNum'] = 70
+    before = pd.DataFrame({'Season': season, 'TeamID': team_ids[mid_season], 'FirstDayNum': 0, 'LastDayNum': 69,
+                        'CoachName': [f"coach_{c}" for c in old[mid_season]]})
+    return pd.concat([before, first]).sort_values(['TeamID', 'FirstDayNum'])
+
+
+def _massey(rng, season, team_ids, strength, systems, days):
+    n_teams = len(team_ids)
+    noise = rng.normal(0, 3, (len(systems), len(days), n_teams))
+    # later snapshots track the true strength more closely
+    noise *= np.linspace(2, 1, len(days))[None, :, None]
+    ranks = np.argsort(np.argsort(-(strength[None, None, :] + noise), axis=2), axis=2) + 1
+    return pd.DataFrame({'Season': season,
+                        'RankingDayNum': np.repeat(np.tile(days, len(systems)), n_teams),
+                        'SystemName': np.repeat(systems, len(days)*n_teams),
+                        'TeamID': np.tile(team_ids, len(systems)*len(days)),
+                        'OrdinalRank': ranks.ravel()})
+
+
+def generate(data_dir: str,
+            stage: int = 2,
+            min_season: int = 1985,
+            max_season: int = 2022,
+            n_teams: int = 360,
+            games_per_season: int = 5400,
+            n_systems: int = 30,
+            ranking_days: int = 14,
+            seed: int = 0) -> dict:
+    """Write the synthetic raw tables to {data_dir}/MDataFiles_Stage{stage}/ (the RawFeatures layout).
+
+    Massey ordinals start in 2003 like the real data and always include a day 133 snapshot.
+
+    Returns:
+        dict: table name -> rows written.
+    """
+    if n_teams < 68:
+        raise ValueError("need at least 68 teams to seed a tournament")
+    rng = np.random.default_rng(seed)
+    raw_dir = os.path.join(data_dir, f"MDataFiles_Stage{stage}")
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(os.path.join(data_dir, 'model-dev', 'training'), exist_ok=True)
+
+    team_ids = np.arange(1101, 1101 + n_teams)
+    strength = rng.normal(0, 7, n_teams)
+    conf_names = np.array(MAJOR_CONF + [f"conf_{i}" for i in range(max(1, n_teams//10 - len(MAJOR_CONF)))])
+    conference = conf_names[rng.integers(0, len(conf_names), n_teams)]
+    coach_ids = np.arange(n_teams)
+    systems = np.array((GOOD_RANKINGS + [f"S{i:02d}" for i in range(max(0, n_systems - len(GOOD_RANKINGS)))])[:n_systems])
+    days = np.unique(np.r_[np.linspace(9, 133, ranking_days).astype(int), 133])
+
+    tables = {name: [] for name in ['MRegularSeasonDetailedResults', 'MNCAATourneyCompactResults', 'MNCAATourneySeeds',
+                                    'MConferenceTourneyGames', 'MTeamCoaches', 'MMasseyOrdinals']}
+    for season in range(min_season, max_season + 1):
+        strength = .8*strength + rng.normal(0, 3, n_teams)
+        tables['MRegularSeasonDetailedResults'].append(_regular_season(rng, season, team_ids, strength, games_per_season))
+        seeds, tourney = _tournament(rng, season, team_ids, strength)
+        tables['MNCAATourneySeeds'].append(seeds)
+        tables['MNCAATourneyCompactResults'].append(tourney)
+        tables['MConferenceTourneyGames'].append(_conference_tourneys(rng, season, team_ids, strength, conference))
+        tables['MTeamCoaches'].append(_coaches(rng, season, team_ids, coach_ids))
+        if season >= 2003:
+            tables['MMasseyOrdinals'].append(_massey(rng, season, team_ids, strength, systems, days))
+
+    tables = {name: pd.concat(frames, ignore_index=True) for name, frames in tables.items() if frames}
+    tables['MRegularSeasonCompactResults'] = tables['MRegularSeasonDetailedResults'][COMPACT_COLUMNS]
+    rows = {}
+    for name, df in tables.items():
+        df.to_csv(os.path.join(raw_dir, f"{name}.csv"), index=False)
+        rows[name] = len(df)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='write kaggle shaped synthetic march madness data')
+    parser.add_argument('data_dir')
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--stage', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    for name, value in SCALES['small'].items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=None)
+    args = parser.parse_args()
+    params = dict(SCALES[args.scale])
+    params.update({k: v for k, v in vars(args).items() if k in params and v is not None})
+    for name, n in generate(args.data_dir, stage=args.stage, seed=args.seed, **params).items():
+        print(f"{name}: {n:,} rows")
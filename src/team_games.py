@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+# the kaggle results tables have one row per game with W*/L* column pairs. the team-game table stacks
+# the winner and loser views of each game, so every per-team aggregate is a single groupby over it:
+# own stats keep their name (Score, FGM, ...), the opponent's get an Opp prefix (OppScore, OppFGM, ...).
+LOC_FLIP = {'H': 'A', 'A': 'H', 'N': 'N'}
+TEAM_KEYS = ['Season', 'TeamID']
+# box score totals behind the regular season features: total name -> team-game column
+BOX_SCORE_TOTALS = {'total_score': 'Score', 'fgm': 'FGM', 'fga': 'FGA', 'fgm3': 'FGM3', 'fga3': 'FGA3',
+                    'ftm': 'FTM', 'fta': 'FTA', 'orb': 'OR', 'drb': 'DR', 'ast': 'Ast', 'to': 'TO',
+                    'stl': 'Stl', 'blk': 'Blk', 'fouls': 'PF'}
+
+
+def _interleave(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    out = np.empty(2*len(first), dtype=np.result_type(first, second))
+    out[0::2] = first
+    out[1::2] = second
+    return out
+
+
+def team_game_table(df: pd.DataFrame) -> pd.DataFrame:
+    """One row per team per game. Games are numbered (game_id) in (Season, DayNum) order and the table
+    keeps that order, the winner's row first: rows 2i and 2i + 1 are the two sides of game i."""
+    if 'DayNum' in df.columns:
+        df = df.sort_values(['Season', 'DayNum'], kind='stable')
+    n_games = len(df)
+    w_team = df['WTeamID'].to_numpy()
+    l_team = df['LTeamID'].to_numpy()
+    data = {'game_id': np.repeat(np.arange(n_games), 2),
+            'TeamID': _interleave(w_team, l_team),
+            'OppTeamID': _interleave(l_team, w_team),
+            'win': np.tile(np.array([1, 0], dtype=np.int64), n_games)}
+    paired = [c[1:] for c in df.columns if c[0] == 'W' and f"L{c[1:]}" in df.columns and c not in ('WTeamID', 'WLoc')]
+    shared = [c for c in df.columns if c[0] not in ('W', 'L') or (c[1:] not in paired and c not in ('WTeamID', 'LTeamID', 'WLoc'))]
+    for c in shared:
+        data[c] = np.repeat(df[c].to_numpy(), 2)
+    if 'WLoc' in df.columns:
+        w_loc = df['WLoc'].to_numpy()
+        data['Loc'] = _interleave(w_loc, pd.Series(w_loc).map(LOC_FLIP).to_numpy())
+    for c in paired:
+        w_values = df[f"W{c}"].to_numpy()
+        l_values = df[f"L{c}"].to_numpy()
+        data[c] = _interleave(w_values, l_values)
+        data[f"Opp{c}"] = _interleave(l_values, w_values)
+    columns = [c for c in ['Season', 'DayNum'] if c in data] + [c for c in data if c not in ('Season', 'DayNum')]
+    return pd.DataFrame({c: data[c] for c in columns})
+
+
+def close_games(df: pd.DataFrame) -> pd.Series:
+    # decided by 10 points or less, or went to overtime
+    return (df['Score'] - df['OppScore']).abs().le(10) | (df['NumOT'] > 0)
+
+
+# the feature formulas work on per team totals, whether summed over a season or up to a given day (as_of.py)
+def box_score_features(totals: pd.DataFrame) -> pd.DataFrame:
+    """Adds the per game / percentage features to totals holding games, wins and the BOX_SCORE_TOTALS."""
+    totals['win_perc'] = totals['wins']/totals['games']
+    totals['ppg'] = totals['total_score']/totals['games']
+    totals['fg_perc'] = totals['fgm']/totals['fga']
+    totals['fg3_perc'] = totals['fgm3']/totals['fga3']
+    totals['ft_perc'] = totals['ftm']/totals['fta']
+    totals['rb_pg'] = (totals['orb'] + totals['drb'])/totals['games']
+    totals['orb_pg'] = totals['orb']/totals['games']
+    totals['drb_pg'] = totals['drb']/totals['games']
+    totals['apg'] = totals['ast']/totals['games']
+    totals['ast_tov'] = totals['ast']/totals['to']
+    totals['tov_pg'] = totals['to']/totals['games']
+    totals['stl_pg'] = totals['stl']/totals['games']
+    totals['second_chance'] = (totals['stl'] + totals['orb'])/totals['to']
+    totals['p_fgm_ast'] = totals['ast']/totals['fgm']
+    totals['blk_pg'] = totals['blk']/totals['games']
+    totals['blk_to_fouls'] = totals['blk']/totals['fouls']
+    totals['fouls_pg'] = totals['fouls']/totals['games']
+    totals['tsp'] = totals['total_score']/(2*(totals['fga'] + .44*totals['fta']))
+    return totals
+
+
+def opponent_features(totals: pd.DataFrame) -> pd.DataFrame:
+    """Adds close_win_perc, win_perc_l10, oppg and pythag_wins to totals holding games, total_score,
+    opp_score, close_games, close_wins and l10_wins."""
+    # teams without a close game come out NaN and take the stage fill
+    totals['close_win_perc'] = totals['close_wins']/totals['close_games'].replace(0, np.nan)
+    totals['win_perc_l10'] = totals['l10_wins']/10
+    totals['oppg'] = totals['opp_score']/totals['games']
+    totals['pythag_wins'] = totals['total_score']**(11.5)/(totals['total_score']**(11.5) + totals['opp_score']**(11.5))
+    return totals